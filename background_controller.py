@@ -1,22 +1,30 @@
 import time
 from threading import *
-
-import numpy
+from queue import Queue
 
 from mfli_driver import MFLIDriver
 from zaber_driver import ZaberDriver
 from data_processor import DataProcessor
+from data_processor import CoherentInterferogramAverager
+from data_processor import SpectralStatisticsAccumulator
+from data_processor import ScanPipelineCache
+from data_processor import convertWattsToDBm
+from parallel_processor import ParallelScanProcessor
+from scan_quality import ScanQualityGate
+from session_store import ScanSessionStore
+from session_store import ScanArrayStore
+from session_store import MappedScanArrays
 import logging
 import numpy as np
 import math
-
-from tkinter import messagebox
+from collections import Counter
 
 class BackgroundController:
 
-    def __init__(self, mfliDrv, zaberDrv):
+    def __init__(self, mfliDrv, zaberDrv, sessionDirectory=None, scansKeptInMemory=8):
         print("Background controller created")
         self.stopRequestFlag = False
+        self.busyFlag = False   # a measurement or a reprocessing is running
 
         self.DataAnalyzer = DataProcessor()
         self.orderedMeasurementsCount = 0
@@ -30,6 +38,20 @@ class BackgroundController:
         self.triggerHysteresis = None
         self.triggerReference = None
         self.selectedApodizationWindowType = None
+        self.selectedProcessingPrecision = "float64"
+        self.selectedPhaseExtractionMethod = "hilbert"
+        self.selectedProcessingAlgorithm = "hilbert"
+        self.selectedAveragingMode = "spectrum"
+        self.coherentPerScanSpectra = False     # in the coherent averaging mode calculate spectra of single scans for display
+        self.CoherentAverager = CoherentInterferogramAverager(self.DataAnalyzer)
+        self.SpectrumStatistics = SpectralStatisticsAccumulator()   # per-bin statistics of the spectra of single scans
+        self.ParallelProcessor = ParallelScanProcessor()     # stored scans are reprocessed in worker processes
+        self.QualityGate = ScanQualityGate()
+        self.scanQualityMode = "off"    # checks of the raw records before the processing: "off", "flag" or "reject"
+        self.bidirectionalScanning = False  # scans are acquired on both sweeps of the delay line
+        self.scanQueueLength = 2    # acquired scans waiting for the processing, the acquisition blocks when it is full
+        self.scanQueue = None
+        self.processingFailMessages = []    # failures of the processing thread, the scans are acquired again
 
         self.MFLIDriver     = mfliDrv
         self.ZaberDriver    = zaberDrv
@@ -42,18 +64,27 @@ class BackgroundController:
         self.UploadNewDataMethod            = None
         self.SendResultsToPlot              = None
         self.NotifyAllMeasurementsDone      = None
+        self.ShowErrorMethod                = None
 
         self.ZaberPort                      = None
         self.MFLIDeviceName                 = None
 
-        self.rawInterferograms = []
-        self.rawReferenceSignals = []
-        self.processedInterferogramsX = []
-        self.processedInterferogramsY = []
-        self.spectraX = []
-        self.spectraY = []
+        # per-scan arrays are written to files of the session store, only the last scansKeptInMemory scans stay
+        # in RAM, older ones are read back as memory mapped views
+        self.SessionStore = ScanSessionStore(sessionDirectory, scansKeptInMemory)
+        self.rawInterferograms = self.SessionStore.createArrayStore("rawInterferograms")
+        self.rawReferenceSignals = self.SessionStore.createArrayStore("rawReferenceSignals")
+        self.processedInterferogramsX = self.SessionStore.createArrayStore("processedInterferogramsX")
+        self.processedInterferogramsY = self.SessionStore.createArrayStore("processedInterferogramsY")
+        self.spectraX = []      # common spectrum X axis shared by the spectra, kept in RAM
+        self.spectraY = self.SessionStore.createArrayStore("spectraY")
+        self.reprocessChunkLength = 32  # scans copied to the shared memory at once by the parallel reprocessing
         self.averageSpectrumX = None
         self.averageSpectrumY = None
+        self.averageSpectrumBand = None     # lower and upper bound of the average spectrum (+/- standard error)
+        self.scanCaches = []    # intermediate results of every stored scan, used when the scans are reprocessed
+        self.scanQualityReasons = []    # reasons why the stored scans were flagged by the quality gate
+        self.backwardScans = []     # flags of the stored scans acquired on the return sweep of the delay line
 
     def setZaberPort(self, port):
         self.ZaberPort = port
@@ -100,10 +131,23 @@ class BackgroundController:
 
 
     def performMeasurements(self, measurementsCount, samplingFrequency, scanStart, scanLength, scanSpeed,
-                            trigModeEnabled, trigLevel, trigHysteresis, trigReference, apodizationWindow):
+                            trigModeEnabled, trigLevel, trigHysteresis, trigReference, apodizationWindow,
+                            processingPrecision="float64", phaseExtraction="hilbert", processingAlgorithm="hilbert",
+                            spectrumRangeMin=None, spectrumRangeMax=None, averagingMode="spectrum",
+                            zeroPaddingPolicy="fixed", decimationEnabled=False, scanQualityMode="off",
+                            averagingStatistic="mean", bidirectionalScanning=False):
         logging.info(f"Application controller: measurement starting")
 
+        if self.busyFlag:
+            self.SetStatusMessageMethod("Wait until the current\noperation is completed")
+            return
+
+        self.busyFlag = True
+
         # reset and configure the backgroung controller
+        self.scanCaches.clear()
+        self.scanQualityReasons.clear()
+        self.backwardScans.clear()
         self.rawInterferograms.clear()
         self.rawReferenceSignals.clear()
         self.processedInterferogramsX.clear()
@@ -112,18 +156,26 @@ class BackgroundController:
         self.spectraY.clear()
         self.averageSpectrumX = None
         self.averageSpectrumY = None
+        self.averageSpectrumBand = None
 
         self.orderedMeasurementsCount   = measurementsCount
         self.mfliFrequencyIndex         = samplingFrequency
         self.scanStartPosition          = scanStart
         self.scanLength                 = scanLength
         self.scanSpeed                  = scanSpeed
-        self.selectedApodizationWindowType = apodizationWindow
+        self.applyProcessingSettings(apodizationWindow, processingPrecision, phaseExtraction, processingAlgorithm,
+                                     spectrumRangeMin, spectrumRangeMax, averagingMode, zeroPaddingPolicy,
+                                     decimationEnabled, averagingStatistic)
+        self.CoherentAverager.reset()
+        self.DataAnalyzer.stageTimer.resetRun()
+        self.SpectrumStatistics.reset()
 
         self.triggerModeEnabled         = trigModeEnabled
         self.triggerLevel               = trigLevel
         self.triggerHysteresis          = trigHysteresis
         self.triggerReference           = trigReference
+        self.scanQualityMode            = scanQualityMode
+        self.bidirectionalScanning      = bidirectionalScanning
 
         self.stopRequestFlag            = False
 
@@ -131,16 +183,47 @@ class BackgroundController:
         t = Thread(target=self.measurementsWork, daemon=True)
         t.start()
 
+    def applyProcessingSettings(self, apodizationWindow, processingPrecision, phaseExtraction, processingAlgorithm,
+                                spectrumRangeMin, spectrumRangeMax, averagingMode, zeroPaddingPolicy="fixed",
+                                decimationEnabled=False, averagingStatistic="mean"):
+        self.selectedApodizationWindowType = apodizationWindow
+        self.selectedProcessingPrecision = processingPrecision
+        self.DataAnalyzer.setPrecision(processingPrecision)
+        self.selectedPhaseExtractionMethod = phaseExtraction
+        self.DataAnalyzer.phaseExtractionMethod = phaseExtraction
+        self.selectedProcessingAlgorithm = processingAlgorithm
+        self.DataAnalyzer.processingAlgorithm = processingAlgorithm
+        self.DataAnalyzer.zoomRangeMin = spectrumRangeMin
+        self.DataAnalyzer.zoomRangeMax = spectrumRangeMax
+        self.DataAnalyzer.paddingPolicy = zeroPaddingPolicy
+        # raw records are decimated according to the sampling frequency and the scan speed of the last measurement
+        if decimationEnabled:
+            self.DataAnalyzer.samplingFrequency = MFLIDriver.MFLISamplingRates[self.mfliFrequencyIndex]
+            self.DataAnalyzer.scanSpeed = self.scanSpeed
+        else:
+            self.DataAnalyzer.samplingFrequency = None
+            self.DataAnalyzer.scanSpeed = None
+        self.selectedAveragingMode = averagingMode
+        # the power averaging works on linear spectra, they are converted to dBm only for display and export
+        self.DataAnalyzer.spectrumUnit = "W" if averagingMode == "power" else "dBm"
+        # a new accumulator, the one of the stored spectra stays intact until they are replaced
+        self.SpectrumStatistics = SpectralStatisticsAccumulator(averagingStatistic)
+        self.SpectrumStatistics.spectrumUnit = self.DataAnalyzer.spectrumUnit
+
 
     def measurementsWork(self):
         self.SetStatusMessageMethod("Preparing...")
 
         if self.stopRequestFlag:
             self.stopRequestFlag = False
+            self.busyFlag = False
             self.SetStatusMessageMethod("Measurement stopped")
             return
 
-        status = self.performAcqusition()
+        try:
+            status = self.performAcqusition()
+        finally:
+            self.busyFlag = False
 
         if status == "ok":
             self.allMeasurementsDone()  # all ordered measurements are completed, terminate gracefully
@@ -148,13 +231,15 @@ class BackgroundController:
             self.SetStatusMessageMethod("Measurement stopped")
         else:
             self.SetStatusMessageMethod("Measurement failed")
-            messagebox.showerror('Measurement failed', status)
+            self.ShowErrorMethod('Measurement failed', status)
 
 
     def performAcqusition(self):
         self.ZaberDriver.waitUntilIdle()
         mfliSamplingFrequency = MFLIDriver.MFLISamplingRates[self.mfliFrequencyIndex]
-        self.mfliSamplesCount = (self.scanLength / (self.scanSpeed * 1000)) * mfliSamplingFrequency
+        self.mfliSamplesCount = int(math.ceil((self.scanLength / (self.scanSpeed * 1000)) * mfliSamplingFrequency))
+        # round the record length up to a length that is fast to transform
+        self.mfliSamplesCount = self.DataAnalyzer.fftPlanner.fastLength(self.mfliSamplesCount)
 
         # configure MFLI
         self.MFLIDriver.configureForMeasurement(samplingFreqIndex=self.mfliFrequencyIndex,
@@ -166,30 +251,91 @@ class BackgroundController:
 
         time.sleep(1)
 
+        # acquired records are processed in a separate thread while the next scan is acquired, the queue is bounded
+        # so that the acquisition can not run away from a slow processing
+        self.processingFailMessages.clear()
+        self.scanQueue = Queue(maxsize=self.scanQueueLength)
+        processingThread = Thread(target=self.processingWork, daemon=True)
+        processingThread.start()
+
+        try:
+            status, failMessages = self.acquireScans()
+        finally:
+            # scans already acquired are processed before the measurement ends
+            self.scanQueue.put(None)
+            processingThread.join()
+
+        completedMeasurements = len(self.rawInterferograms)
+
+        if status == "stop":
+            # keep the average of the scans acquired so far
+            if self.selectedAveragingMode == "coherent" and self.CoherentAverager.scansCount > 0:
+                self.finishCoherentAverage(completedMeasurements)
+
+            self.logRunTimings()
+
+            self.SetStatusMessageMethod("Measurement stopped")
+            return "stop"
+
+        if status != "ok":
+            return status
+
+        if self.selectedAveragingMode == "coherent":
+            self.finishCoherentAverage(completedMeasurements)
+
+        self.logRunTimings()
+
+        failMessages = failMessages + self.processingFailMessages
+        flaggedScansCount = sum(1 for reasons in self.scanQualityReasons if len(reasons) > 0)
+        if flaggedScansCount > 0 or len(failMessages) > 0:
+            logging.info(f"{flaggedScansCount} of {completedMeasurements} scans flagged by the quality gate, "
+                         f"failures: {dict(Counter(failMessages))}")
+
+        return "ok"
+
+    def acquireScans(self):
+        # producer of the acquisition pipeline - moves the delay line, acquires the records and puts them into
+        # the scan queue; returns the status and messages of the failed acquisitions
         failedAcquisitionsCount = 0
         failMessages = []
+        nextScanBackward = False    # in the bidirectional mode the sweeps alternate, starting with a forward one
 
         # acquire all data
         i = 0
-        while i < self.orderedMeasurementsCount:
+        while True:
+            # scans failed in the processing are replaced, their failures are known only after they are processed
+            processingFailuresCount = len(self.processingFailMessages)
+
+            if i - processingFailuresCount >= self.orderedMeasurementsCount:
+                self.scanQueue.join()
+
+                if len(self.processingFailMessages) == processingFailuresCount:
+                    break
+
+                continue
+
             i += 1
         # for i in range(0, self.orderedMeasurementsCount):
-            if failedAcquisitionsCount >= math.ceil(self.orderedMeasurementsCount * 0.2):
+            if (failedAcquisitionsCount + processingFailuresCount >=
+                    math.ceil(self.orderedMeasurementsCount * 0.2)):
 
                 if self.orderedMeasurementsCount == 1:
                     errstatus = "Single measurement failed"
                 else:
                     errstatus = "More than 20% of the ordered measurements failed"
 
-                return errstatus
+                reasons = ", ".join(f"{reason} ({count}x)" for reason, count in
+                                    Counter(failMessages + self.processingFailMessages).items())
+                logging.info(f"Measurement failed: {reasons}")
+
+                return f"{errstatus}\n{reasons}", failMessages
 
             self.ZaberDriver.waitUntilIdle()
             time.sleep(0.25)  # wait to let the mirror settle
 
             if self.stopRequestFlag:
                 self.stopRequestFlag = False
-                self.SetStatusMessageMethod("Measurement stopped")
-                return "stop"
+                return "stop", failMessages
 
             # calculate start and stop positions for the delay line
             # note: direction of scan from zaber motor to the other end
@@ -204,11 +350,25 @@ class BackgroundController:
             if startPosition > self.ZaberDriver.DelayLineNominalLength:
                 startPosition = self.ZaberDriver.DelayLineNominalLength
 
+            # a return sweep starts where the previous forward sweep ended
+            backwardScan = self.bidirectionalScanning and nextScanBackward
+
+            if backwardScan:
+                sweepStartPosition, sweepEndPosition = endPosition, startPosition
+            else:
+                sweepStartPosition, sweepEndPosition = startPosition, endPosition
+
             # send the delay line to the starting position
-            self.ZaberDriver.setPosition(position=startPosition, speed=ZaberDriver.MaxSpeed)
+            self.ZaberDriver.setPosition(position=sweepStartPosition, speed=ZaberDriver.MaxSpeed)
 
             # if trigger mode is enabled arm the trigger and wait for a moment until it takes effect
             if self.triggerModeEnabled:
+                # the record of a return sweep is reversed before processing, so its trigger is placed at the mirrored
+                # position and the ZPD ends up at the same place in the records of both directions
+                if self.bidirectionalScanning:
+                    triggerReference = 100 - self.triggerReference if backwardScan else self.triggerReference
+                    self.MFLIDriver.setTriggerReference(triggerReference)
+
                 self.MFLIDriver.armTrigger()
                 # time.sleep(1.0)
 
@@ -216,11 +376,17 @@ class BackgroundController:
             self.ZaberDriver.waitUntilIdle()
             time.sleep(1.0)  # wait to let the mirror settle
 
-            self.SetStatusMessageMethod("Acquisition...")
+            self.SetStatusMessageMethod("Acquisition (return sweep)..." if backwardScan else "Acquisition...")
             # acquire data (note: zaber uses us/s, interface uses mm/s)
             # prepare scanning trajectory with a 0.1 sec marging if possible
 
-            self.ZaberDriver.setPosition(endPosition, speed=self.scanSpeed * 1000)
+            self.ZaberDriver.setPosition(sweepEndPosition, speed=self.scanSpeed * 1000)
+
+            # a record started together with the sweep covers the first part of the travel, which for the return
+            # sweep is shifted by both margins against the forward one; the return record is started later to cover
+            # the same part of the scan (a triggered record is aligned on the ZPD by the mirrored trigger reference)
+            if backwardScan and not self.triggerModeEnabled:
+                time.sleep(2 * preferred_margin / (self.scanSpeed * 1000))
 
             # if self.scanStartPosition-self.scanLength > preferred_margin:
             #     self.ZaberDriver.setPosition(position=self.scanStartPosition - self.scanLength - preferred_margin,
@@ -236,68 +402,500 @@ class BackgroundController:
 
             self.ZaberDriver.waitUntilIdle()
 
+            # the next sweep starts at the end of this one, whether the acquisition succeeded or not
+            if self.bidirectionalScanning:
+                nextScanBackward = not backwardScan
+
             # try to complete the measurement even if acquisition fails a few times
             if measStatus != "ok":
                 failedAcquisitionsCount += 1
+                failMessages.append(measStatus)
                 i -= 1
                 print("Measurement cycle skipped due to error: " + measStatus)
                 continue
 
-            # send the delay line to the starting position while the calculations are running
-            self.ZaberDriver.setPosition(position=startPosition, speed=ZaberDriver.MaxSpeed)
-
-            self.SetStatusMessageMethod("Calculations...")
-            # synchronization delay
-            # time.sleep(0.1)
+            # send the delay line to the starting position while the calculations are running,
+            # in the bidirectional mode the next scan starts from the current position
+            if not self.bidirectionalScanning:
+                self.ZaberDriver.setPosition(position=startPosition, speed=ZaberDriver.MaxSpeed)
+
+            # cheap checks of the raw records, a rejected scan does not go through the processing
+            qualityReasons = []
+
+            if self.scanQualityMode != "off":
+                quality = self.QualityGate.check(self.MFLIDriver.lastReferenceData,
+                                                 self.MFLIDriver.lastInterferogramData)
+                qualityReasons = quality["reasons"]
+
+                if len(qualityReasons) > 0:
+                    logging.info(f"Scan quality: {', '.join(qualityReasons)} "
+                                 f"({self.QualityGate.formatQuality(quality)})")
+
+                if len(qualityReasons) > 0 and self.scanQualityMode == "reject":
+                    self.SetStatusMessageMethod(f"Scan rejected:\n{qualityReasons[0]}")
+                    failedAcquisitionsCount += 1
+                    failMessages.extend(qualityReasons)
+                    i -= 1
+                    continue
+
+            # the driver replaces its record with every acquisition, the queued records are copies;
+            # the queue blocks when the processing falls behind by scanQueueLength scans
+            self.scanQueue.put({"rawReferenceSignal": np.copy(self.MFLIDriver.lastReferenceData),
+                                "rawInterferogram": np.copy(self.MFLIDriver.lastInterferogramData),
+                                "backwardScan": backwardScan,
+                                "qualityReasons": qualityReasons})
+
+        return "ok", failMessages
+
+    def processingWork(self):
+        # consumer of the acquisition pipeline - processes the queued scans in the order of acquisition until
+        # the end of the measurement is signalled with None
+        while True:
+            scan = self.scanQueue.get()
+
+            if scan is None:
+                self.scanQueue.task_done()
+                return
 
             try:
-                # results = self.DataAnalyzer.analyzeData(rawReferenceSignal=self.MFLIDriver.lastReferenceData,
-                #                                         rawInterferogram=self.MFLIDriver.lastInterferogramData)
-                results = self.DataAnalyzer.analyzeDataHilbertInterpolation(rawReferenceSignal=self.MFLIDriver.lastReferenceData,
-                                                        rawInterferogram=self.MFLIDriver.lastInterferogramData,
-                                                        apodizationWindowType=self.selectedApodizationWindowType)
-            except:
-                self.SetStatusMessageMethod("Data acquisition or analysis failed")
-                failedAcquisitionsCount += 1
-                i -= 1
-                print("Data acquisition or analysis failed due to exception")
-                continue
+                self.processScan(scan)
+            except Exception as e:
+                # the acquisition thread acquires another scan in place of this one
+                logging.info(f"Processing of a scan failed: {e}")
+                self.SetStatusMessageMethod("Processing of a scan failed")
+                self.processingFailMessages.append("processing failed")
+            finally:
+                self.scanQueue.task_done()
+
+    def processScan(self, scan):
+        self.SetStatusMessageMethod("Calculations...")
+        # synchronization delay
+        # time.sleep(0.1)
+
+        # intermediate results of the scan are kept for reprocessing with different settings
+        cache = ScanPipelineCache()
+
+        try:
+            # results = self.DataAnalyzer.analyzeData(rawReferenceSignal=self.MFLIDriver.lastReferenceData,
+            #                                         rawInterferogram=self.MFLIDriver.lastInterferogramData)
+            if self.selectedAveragingMode == "coherent":
+                results = self.analyzeScanCoherently(scan["rawReferenceSignal"], scan["rawInterferogram"],
+                                                     scan["backwardScan"])
+            else:
+                # the spectrum is written directly to the array kept in the list of spectra
+                spectrumY = np.empty(self.DataAnalyzer.getSpectrumLength(), dtype=self.DataAnalyzer.realType)
+                results = self.DataAnalyzer.processInto(rawReferenceSignal=scan["rawReferenceSignal"],
+                                                        rawInterferogram=scan["rawInterferogram"],
+                                                        apodizationWindowType=self.selectedApodizationWindowType,
+                                                        out=spectrumY,
+                                                        cache=cache,
+                                                        backwardScan=scan["backwardScan"])
+        except:
+            # the acquisition thread acquires another scan in place of this one
+            self.SetStatusMessageMethod("Data acquisition or analysis failed")
+            self.processingFailMessages.append("analysis failed")
+            print("Data acquisition or analysis failed due to exception")
+
+            # the coherent average may already contain the scan
+            if self.selectedAveragingMode == "coherent":
+                self.rebuildAverages()
+            return
+
+        self.logProcessingTimings(results["timings"])
+
+        # the scan is stored and added to the averages together, if any of it fails the scan is removed again
+        storedScans = self.getStoredScansLengths()
 
-            self.rawInterferograms.append(np.copy(self.MFLIDriver.lastInterferogramData))
-            self.rawReferenceSignals.append(np.copy(self.MFLIDriver.lastReferenceData))
-            self.spectraX.append(np.copy(results["spectrumX"]))
-            self.spectraY.append(np.copy(results["spectrumY"]))
+        try:
+            self.scanCaches.append(cache)
+            self.scanQualityReasons.append(scan["qualityReasons"])
+            self.backwardScans.append(scan["backwardScan"])
+            self.rawInterferograms.append(scan["rawInterferogram"])
+            self.rawReferenceSignals.append(scan["rawReferenceSignal"])
             self.processedInterferogramsX.append(np.copy(results["interferogramX"]))
             self.processedInterferogramsY.append(np.copy(results["interferogramY"]))
 
-            # equalize lengths of all spectra before averaging
-            minimalSpectrumLength = len(self.spectraX[0])
+            if results["spectrumY"] is not None:
+                # spectrum X axis is common to all spectra and read-only, so it is shared instead of copied
+                self.spectraX.append(results["spectrumX"])
+                self.spectraY.append(results["spectrumY"])
 
-            for s in self.spectraX:
-                if len(s) < minimalSpectrumLength:
-                    minimalSpectrumLength = len(s)
+            if self.selectedAveragingMode != "coherent":
+                self.accumulateSpectrum(results["spectrumX"], results["spectrumY"])
+                self.updateAverage()
 
-            for z in range(0, len(self.spectraX)):
-                if len(self.spectraX[z]) > minimalSpectrumLength:
-                    self.spectraX[z] = self.spectraX[z][:minimalSpectrumLength - 1]
-                    self.spectraY[z] = self.spectraY[z][:minimalSpectrumLength - 1]
+            # spectra in watts are converted to dBm by the GUI, only when they are drawn
+            self.SendResultsToPlot(results["interferogramX"], results["rawInterferogramY"],
+                                   results["spectrumX"], results["spectrumY"],
+                                   self.averageSpectrumX, self.averageSpectrumY, len(self.rawInterferograms),
+                                   results["apodizationWindow"], self.averageSpectrumBand,
+                                   spectrumUnit=self.DataAnalyzer.spectrumUnit)
+        except:
+            self.truncateStoredScans(storedScans)
+            self.rebuildAverages()
+            raise
+
+        self.releaseOldScanCache(len(self.scanCaches) - 1)
+
+    def getStoredScansLengths(self):
+        return [len(sequence) for sequence in self.getStoredScansSequences()]
+
+    def getStoredScansSequences(self):
+        return [self.scanCaches, self.scanQualityReasons, self.backwardScans, self.rawInterferograms,
+                self.rawReferenceSignals, self.processedInterferogramsX, self.processedInterferogramsY,
+                self.spectraX, self.spectraY]
+
+    def getProcessedResults(self):
+        # results calculated from the stored raw scans, the reprocessing replaces all of them at once
+        return {"processedInterferogramsX": self.processedInterferogramsX,
+                "processedInterferogramsY": self.processedInterferogramsY,
+                "spectraX": self.spectraX,
+                "spectraY": self.spectraY,
+                "SpectrumStatistics": self.SpectrumStatistics,
+                "averageSpectrumX": self.averageSpectrumX,
+                "averageSpectrumY": self.averageSpectrumY,
+                "averageSpectrumBand": self.averageSpectrumBand}
+
+    def createProcessedResults(self):
+        # empty results written by the reprocessing next to the previous ones, which stay valid until it succeeds;
+        # the spectral statistics were already replaced together with the processing settings
+        return {"processedInterferogramsX": self.SessionStore.createArrayStore("processedInterferogramsX"),
+                "processedInterferogramsY": self.SessionStore.createArrayStore("processedInterferogramsY"),
+                "spectraX": [],
+                "spectraY": self.SessionStore.createArrayStore("spectraY"),
+                "averageSpectrumX": None,
+                "averageSpectrumY": None,
+                "averageSpectrumBand": None}
+
+    def setProcessedResults(self, results):
+        for name, value in results.items():
+            setattr(self, name, value)
+
+    def releaseProcessedResults(self, results):
+        # removes the files of replaced results
+        for value in results.values():
+            if isinstance(value, ScanArrayStore):
+                self.SessionStore.removeArrayStore(value)
+
+    def truncateStoredScans(self, lengths):
+        # removes the arrays of a scan that was not stored completely
+        for sequence, length in zip(self.getStoredScansSequences(), lengths):
+            if isinstance(sequence, list):
+                del sequence[length:]
+            else:
+                sequence.truncate(length)
 
-            # calculate an average spectrum
-            sumArr = numpy.zeros(len(self.spectraY[0]))
-            for s in self.spectraY:
-                sumArr += s
+    def rebuildAverages(self):
+        # running averages built again from the stored scans after a scan failed halfway through them
+        if self.selectedAveragingMode == "coherent":
+            self.CoherentAverager.reset()
 
-            sumArr /= len(self.spectraY)
+            for i in range(len(self.rawInterferograms)):
+                self.CoherentAverager.addScan(self.rawReferenceSignals[i], self.rawInterferograms[i],
+                                              self.backwardScans[i])
+            return
 
-            self.averageSpectrumX = self.spectraX[0]
-            self.averageSpectrumY = sumArr
+        self.SpectrumStatistics.reset()
+        self.averageSpectrumX = None
+        self.averageSpectrumY = None
+        self.averageSpectrumBand = None
+
+        for spectrumX, spectrumY in zip(self.spectraX, self.spectraY):
+            self.accumulateSpectrum(spectrumX, spectrumY)
+
+        if len(self.spectraY) > 0:
+            self.updateAverage()
+
+    def releaseOldScanCache(self, index):
+        # intermediate results are kept only for the scans held in RAM, older scans are fully processed again
+        oldIndex = index - self.SessionStore.recentCount
+
+        if 0 <= oldIndex < len(self.scanCaches):
+            self.scanCaches[oldIndex].clear()
+
+    def accumulateSpectrum(self, spectrumX, spectrumY):
+        # adds the spectrum of a single scan to the running statistics, in watts in the power averaging mode
+        if not self.SpectrumStatistics.addSpectrum(spectrumX, spectrumY):
+            logging.info(f"Spectrum rejected from the average as an outlier "
+                         f"({self.SpectrumStatistics.rejectedCount} rejected so far)")
+
+    def updateAverage(self):
+        # average spectrum and its uncertainty band in the unit of the spectra (watts in the power averaging mode,
+        # converted to dBm only for display and export), robust statistics replace the plain mean if selected;
+        # the accumulator is updated in place, so the cost per scan does not grow with the number of scans
+        statistics = self.SpectrumStatistics
+        self.averageSpectrumX = statistics.spectrumX
+        self.averageSpectrumY = statistics.getAverage()
+        self.averageSpectrumBand = statistics.getBand()
+
+    def reprocessAll(self, settings):
+        # process the stored scans again with new settings, without a new acquisition; settings use the names
+        # of the application settings (apodizationWindow, processingPrecision, phaseExtraction, processingAlgorithm,
+        # spectrumRangeMin, spectrumRangeMax, averagingMode, zeroPaddingPolicy, decimationEnabled,
+        # averagingStatistic) and optionally
+        # K - the zero-padding factor of the fixed zero-padding policy
+        # returns False when the request is refused and the settings are not applied
+        logging.info(f"Application controller: reprocessing starting")
+
+        if self.busyFlag:
+            self.SetStatusMessageMethod("Wait until the current\noperation is completed")
+            return False
+
+        if len(self.rawInterferograms) == 0:
+            self.SetStatusMessageMethod("No scans to reprocess")
+            return False
+
+        self.busyFlag = True
+
+        # the current results are restored if the reprocessing fails
+        previousResults = self.getProcessedResults()
+
+        self.applyProcessingSettings(settings["apodizationWindow"],
+                                     settings.get("processingPrecision", "float64"),
+                                     settings.get("phaseExtraction", "hilbert"),
+                                     settings.get("processingAlgorithm", "hilbert"),
+                                     settings.get("spectrumRangeMin"),
+                                     settings.get("spectrumRangeMax"),
+                                     settings.get("averagingMode", "spectrum"),
+                                     settings.get("zeroPaddingPolicy", "fixed"),
+                                     settings.get("decimationEnabled", False),
+                                     settings.get("averagingStatistic", "mean"))
+
+        if "K" in settings:
+            self.DataAnalyzer.K = int(settings["K"])
+
+        self.setProcessedResults(self.createProcessedResults())
+
+        t = Thread(target=self.reprocessingWork, args=(previousResults,), daemon=True)
+        t.start()
 
-            self.SendResultsToPlot(results["interferogramX"], results["rawInterferogramY"],
-                                   results["spectrumX"], results["spectrumY"],
-                                   self.averageSpectrumX, self.averageSpectrumY, i,
-                                   results["apodizationWindow"])
+        return True
 
-        return "ok"
+    def reprocessingWork(self, previousResults):
+        self.SetStatusMessageMethod("Reprocessing...")
+        start = time.perf_counter()
+
+        try:
+            scansCount = len(self.rawInterferograms)
+
+            # the coherent average is a single transform, a process pool would not help there; scans with cached
+            # intermediate results are finished in this process, only the others are worth passing to the workers
+            uncachedCount = sum(not self.DataAnalyzer.isScanCached(cache) for cache in self.scanCaches)
+
+            if (self.selectedAveragingMode != "coherent" and
+                    self.ParallelProcessor.getWorkersCount(uncachedCount) > 1):
+                self.reprocessStoredScansInParallel()
+            else:
+                self.reprocessStoredScans()
+        except Exception as e:
+            logging.info(f"Reprocessing failed: {e}")
+            # the partly written results are dropped, the results of the previous processing stay in use
+            self.releaseProcessedResults(self.getProcessedResults())
+            self.setProcessedResults(previousResults)
+            self.SetStatusMessageMethod("Reprocessing failed")
+            return
+        finally:
+            self.busyFlag = False
+
+        self.releaseProcessedResults(previousResults)
+        logging.info(f"Reprocessing of {scansCount} scans took {time.perf_counter() - start:.2f} s")
+        self.SetStatusMessageMethod("Reprocessing done")
+
+    def reportReprocessingProgress(self, processedCount, scansCount):
+        self.SetStatusMessageMethod(f"Reprocessing...\n{processedCount}/{scansCount}")
+
+    def reprocessStoredScansInParallel(self):
+        # scans without cached intermediate results are processed in worker processes, the scans are independent
+        # of each other; scans with the mirror position in their cache are finished from it in this process;
+        # the results are written to the empty stores created by reprocessAll
+        stageTimer = self.DataAnalyzer.stageTimer
+        stageTimer.resetRun()
+
+        scansCount = len(self.rawInterferograms)
+
+        # the scans are passed to the workers in chunks, so the shared memory and the copied results stay bounded
+        lastScanDetails = None
+
+        for chunkStart in range(0, scansCount, self.reprocessChunkLength):
+            chunkIndices = range(chunkStart, min(chunkStart + self.reprocessChunkLength, scansCount))
+            uncachedIndices = [i for i in chunkIndices if not self.DataAnalyzer.isScanCached(self.scanCaches[i])]
+            chunkResults = {}
+
+            if len(uncachedIndices) > 0:
+                results = self.ParallelProcessor.process(self.DataAnalyzer,
+                                                         [self.rawReferenceSignals[i] for i in uncachedIndices],
+                                                         [self.rawInterferograms[i] for i in uncachedIndices],
+                                                         self.selectedApodizationWindowType,
+                                                         progressCallback=lambda processedCount, _:
+                                                         self.reportReprocessingProgress(chunkStart + processedCount,
+                                                                                         scansCount),
+                                                         backwardScans=[self.backwardScans[i]
+                                                                        for i in uncachedIndices])
+
+                for timings in results["timings"]:
+                    stageTimer.addTimings(timings)
+
+                for i, interferogramX, interferogramY, spectrumY in zip(uncachedIndices, results["interferogramsX"],
+                                                                         results["interferogramsY"],
+                                                                         results["spectraY"]):
+                    spectrumX = self.DataAnalyzer.getSpectrumX(len(self.rawInterferograms[i]))
+                    chunkResults[i] = (interferogramX, interferogramY, spectrumX, spectrumY)
+
+                if uncachedIndices[-1] == scansCount - 1:
+                    lastScanDetails = results["lastScanDetails"]
+
+            # results are stored in the order of the scans
+            for i in chunkIndices:
+                if i not in chunkResults:
+                    results = self.DataAnalyzer.analyze(rawReferenceSignal=self.rawReferenceSignals[i],
+                                                        rawInterferogram=self.rawInterferograms[i],
+                                                        apodizationWindowType=self.selectedApodizationWindowType,
+                                                        cache=self.scanCaches[i],
+                                                        backwardScan=self.backwardScans[i])
+                    self.logProcessingTimings(results["timings"])
+                    chunkResults[i] = (np.copy(results["interferogramX"]), np.copy(results["interferogramY"]),
+                                       results["spectrumX"], results["spectrumY"])
+
+                    if i == scansCount - 1:
+                        lastScanDetails = results
+
+                interferogramX, interferogramY, spectrumX, spectrumY = chunkResults.pop(i)
+                self.processedInterferogramsX.append(interferogramX)
+                self.processedInterferogramsY.append(interferogramY)
+                self.spectraX.append(spectrumX)
+                self.spectraY.append(spectrumY)
+                self.accumulateSpectrum(spectrumX, spectrumY)
+                self.releaseOldScanCache(i)
+
+            self.reportReprocessingProgress(chunkIndices.stop, scansCount)
+
+        self.updateAverage()
+        self.logRunTimings()
+
+        self.SendResultsToPlot(self.processedInterferogramsX[-1], lastScanDetails["rawInterferogramY"],
+                               self.spectraX[-1], self.spectraY[-1],
+                               self.averageSpectrumX, self.averageSpectrumY, scansCount,
+                               lastScanDetails["apodizationWindow"], self.averageSpectrumBand,
+                               spectrumUnit=self.DataAnalyzer.spectrumUnit)
+
+    def reprocessStoredScans(self):
+        # the results are written to the empty stores created by reprocessAll
+        self.DataAnalyzer.stageTimer.resetRun()
+
+        scansCount = len(self.rawInterferograms)
+        coherentAveraging = self.selectedAveragingMode == "coherent"
+
+        # the aligned mean interferogram is reused unless the mirror position has to be calculated again
+        rebuildCoherentAverage = coherentAveraging and (
+                self.CoherentAverager.scansCount != scansCount or
+                self.CoherentAverager.settingsKey != self.CoherentAverager.getSettingsKey())
+
+        if rebuildCoherentAverage:
+            self.CoherentAverager.reset()
+
+        # in the coherent averaging mode the scans are processed on their own as well, so that the stored results
+        # of every scan follow the new settings
+        for i in range(scansCount):
+            results = self.DataAnalyzer.analyze(rawReferenceSignal=self.rawReferenceSignals[i],
+                                                rawInterferogram=self.rawInterferograms[i],
+                                                apodizationWindowType=self.selectedApodizationWindowType,
+                                                cache=self.scanCaches[i],
+                                                backwardScan=self.backwardScans[i])
+            self.logProcessingTimings(results["timings"])
+
+            self.processedInterferogramsX.append(np.copy(results["interferogramX"]))
+            self.processedInterferogramsY.append(np.copy(results["interferogramY"]))
+            self.spectraX.append(results["spectrumX"])
+            self.spectraY.append(results["spectrumY"])
+
+            if rebuildCoherentAverage:
+                # the mirror position calculated for the scan above is taken from its cache
+                self.CoherentAverager.addScan(self.rawReferenceSignals[i], self.rawInterferograms[i],
+                                              self.backwardScans[i], cache=self.scanCaches[i])
+            elif not coherentAveraging:
+                self.accumulateSpectrum(results["spectrumX"], results["spectrumY"])
+
+            self.releaseOldScanCache(i)
+
+        if coherentAveraging:
+            self.finishCoherentAverage(scansCount)
+            self.logRunTimings()
+            return
+
+        self.updateAverage()
+        self.logRunTimings()
+
+        self.SendResultsToPlot(results["interferogramX"], results["rawInterferogramY"],
+                               results["spectrumX"], results["spectrumY"],
+                               self.averageSpectrumX, self.averageSpectrumY, scansCount,
+                               results["apodizationWindow"], self.averageSpectrumBand,
+                               spectrumUnit=self.DataAnalyzer.spectrumUnit)
+
+    def logProcessingTimings(self, timings):
+        stages = ", ".join(f"{name} {1E3 * stage['seconds']:.1f}" for name, stage in timings.items())
+        logging.info(f"Processing timings [ms]: {stages}")
+
+    def logRunTimings(self):
+        summary = self.DataAnalyzer.stageTimer.getRunSummary()
+
+        if len(summary) > 0:
+            logging.info(f"Processing timings of {self.DataAnalyzer.stageTimer.runCallsCount} calls:")
+
+        for line in summary:
+            logging.info(f"    {line}")
+
+    def getSpectraYInDBm(self):
+        # spectra of single scans are kept in watts in the power averaging mode
+        if self.selectedAveragingMode == "power":
+            # converted on access, the converted spectra of all scans are never held in memory at once
+            return MappedScanArrays(self.spectraY, convertWattsToDBm)
+
+        return self.spectraY
+
+    def closeSession(self):
+        # removes the files of the stored scans, called when the application is closed
+        self.SessionStore.close()
+
+    def analyzeScanCoherently(self, rawReferenceSignal, rawInterferogram, backwardScan=False):
+        # align the scan on the ZPD and add it to the running mean interferogram, the spectrum of the single scan
+        # is calculated only when requested for display
+        stageTimer = self.DataAnalyzer.stageTimer
+        stageTimer.startCall()
+
+        with stageTimer.measure("total", len(rawInterferogram)):
+            alignedX, alignedY = self.CoherentAverager.addScan(rawReferenceSignal=rawReferenceSignal,
+                                                               rawInterferogram=rawInterferogram,
+                                                               backwardScan=backwardScan)
+
+            if self.coherentPerScanSpectra:
+                results = self.DataAnalyzer.analyzeResampledInterferogram(alignedX, alignedY,
+                                                                          self.selectedApodizationWindowType)
+            else:
+                window = self.DataAnalyzer.createAssymetricApodizationWindow(alignedY,
+                                                                             self.selectedApodizationWindowType)
+
+                results = {"spectrumX": None,
+                           "spectrumY": None,
+                           "interferogramX": alignedX,
+                           "interferogramY": alignedY * window,
+                           "apodizationWindow": window,
+                           "rawInterferogramY": alignedY}
+
+        results["timings"] = stageTimer.finishCall()
+        return results
+
+    def finishCoherentAverage(self, completedMeasurements):
+        # a single transform of the accumulated interferogram gives the average spectrum
+        self.SetStatusMessageMethod("Calculations...")
+        results = self.CoherentAverager.calculateSpectrum(self.selectedApodizationWindowType)
+
+        self.averageSpectrumX = results["spectrumX"]
+        self.averageSpectrumY = results["spectrumY"]
+
+        self.SendResultsToPlot(results["interferogramX"], results["rawInterferogramY"],
+                               results["spectrumX"], results["spectrumY"],
+                               self.averageSpectrumX, self.averageSpectrumY, completedMeasurements,
+                               results["apodizationWindow"], None)
 
 
     def allMeasurementsDone(self):
@@ -0,0 +1 @@
+# processing throughput benchmarks running on synthetic data, no hardware required
@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import scipy
+
+from data_processor import DataProcessor
+from mfli_sampling_rates import MFLISamplingRates
+from benchmarks.synthetic_interferogram import SyntheticInterferogramGenerator
+
+# run from the repository root:
+#   python -m benchmarks.benchmark_data_processor --output results.json [--compare baseline.json]
+
+# processing configurations: name -> DataProcessor settings
+benchmarkEngines = {
+    "fringes":          {"processingAlgorithm": "fringes"},
+    "hilbert":          {"processingAlgorithm": "hilbert"},
+    "hilbert_float32":  {"processingAlgorithm": "hilbert", "precision": "float32"},
+    "hilbert_iq":       {"processingAlgorithm": "hilbert", "phaseExtractionMethod": "iq"},
+    "nufft":            {"processingAlgorithm": "nufft"},
+    "zoom":             {"processingAlgorithm": "zoom"},
+}
+
+defaultScanLengths = (1000.0, 5000.0, 20000.0)     # um
+defaultScanSpeed = 5.0                              # mm/s
+minimalSamplesPerFringe = 4                         # slower sampling aliases the reference signal
+spectralErrorRange = 20.0                           # spectral error is evaluated where the source is within 20 dB
+
+
+def createDataProcessor(engineSettings):
+    dataProcessor = DataProcessor()
+    dataProcessor.setPrecision(engineSettings.get("precision", "float64"))
+    dataProcessor.processingAlgorithm = engineSettings.get("processingAlgorithm", "hilbert")
+    dataProcessor.phaseExtractionMethod = engineSettings.get("phaseExtractionMethod", "hilbert")
+    return dataProcessor
+
+
+def calculateSpectralError(generator, results):
+    # rms difference [dB] between the spectrum normalized to its peak and the true spectrum of the source
+    trueSpectrum = generator.getTrueSpectrum(results["spectrumX"])
+    band = trueSpectrum > -spectralErrorRange
+
+    measuredSpectrum = results["spectrumY"][band].astype(float)
+    measuredSpectrum -= np.max(measuredSpectrum)
+
+    return float(np.sqrt(np.mean((measuredSpectrum - trueSpectrum[band]) ** 2)))
+
+
+def benchmarkCase(engineName, samplingFrequency, scanLength, scanSpeed, repeats, apodizationWindow, seed):
+    generator = SyntheticInterferogramGenerator(seed)
+    reference, interferogram = generator.generateScan(samplingFrequency, scanLength, scanSpeed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        dataProcessor = createDataProcessor(benchmarkEngines[engineName])
+
+        # the first call fills the caches (windows, spectral grid, FFT plans) and is not timed
+        results = dataProcessor.analyze(reference, interferogram, apodizationWindow)
+        dataProcessor.stageTimer.resetRun()
+
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            dataProcessor.analyze(reference, interferogram, apodizationWindow)
+            durations.append(time.perf_counter() - start)
+
+        # peak memory of a single steady-state call, measured separately as tracing slows the processing down
+        tracemalloc.start()
+        dataProcessor.analyze(reference, interferogram, apodizationWindow)
+        _, peakMemory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stageTimer = dataProcessor.stageTimer
+    stages = {name: stage["seconds"] / stage["calls"] for name, stage in stageTimer.runStages.items()}
+
+    return {"samplesCount": len(interferogram),
+            "meanSeconds": float(np.mean(durations)),
+            "minSeconds": float(np.min(durations)),
+            "scansPerSecond": float(1.0 / np.mean(durations)),
+            "peakMemoryBytes": int(peakMemory),
+            "spectralErrorDB": calculateSpectralError(generator, results),
+            "stageSeconds": stages}
+
+
+def runBenchmarks(engines, rateIndices, scanLengths, scanSpeed, repeats, maxSamplesCount, apodizationWindow, seed):
+    results = []
+    fringeFrequency = scanSpeed * 1000 / (SyntheticInterferogramGenerator().ref_laser_wavelength / 2)
+
+    for rateIndex in rateIndices:
+        samplingFrequency = MFLISamplingRates[rateIndex]
+
+        for scanLength in scanLengths:
+            samplesCount = int(np.ceil((scanLength / (scanSpeed * 1000)) * samplingFrequency))
+
+            for engineName in engines:
+                case = {"engine": engineName,
+                        "samplingFrequencyIndex": rateIndex,
+                        "samplingFrequency": samplingFrequency,
+                        "scanLength": scanLength,
+                        "scanSpeed": scanSpeed}
+
+                if samplingFrequency < minimalSamplesPerFringe * fringeFrequency:
+                    case["skipped"] = "reference signal undersampled"
+                elif samplesCount > maxSamplesCount:
+                    case["skipped"] = f"{samplesCount} samples exceed the limit of {maxSamplesCount}"
+                else:
+                    case.update(benchmarkCase(engineName, samplingFrequency, scanLength, scanSpeed, repeats,
+                                              apodizationWindow, seed))
+
+                print(formatCase(case))
+                results.append(case)
+
+    return results
+
+
+def formatCase(case):
+    description = (f"{case['engine']:>16} {case['samplingFrequency']:>10.4g} Hz {case['scanLength']:>8.0f} um: ")
+
+    if "skipped" in case:
+        return description + f"skipped ({case['skipped']})"
+
+    return description + (f"{case['scansPerSecond']:8.2f} scans/s, {case['peakMemoryBytes'] / 2 ** 20:8.1f} MiB, "
+                          f"error {case['spectralErrorDB']:.3f} dB")
+
+
+def getGitRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compareResults(baselineResults, currentResults):
+    # speed-up of every case present in both runs
+    def caseKey(case):
+        return case["engine"], case["samplingFrequencyIndex"], case["scanLength"], case["scanSpeed"]
+
+    baselineCases = {caseKey(case): case for case in baselineResults["results"] if "skipped" not in case}
+
+    print(f"Comparison with {baselineResults.get('label') or baselineResults.get('revision')}:")
+    for case in currentResults["results"]:
+        baselineCase = baselineCases.get(caseKey(case))
+
+        if "skipped" in case or baselineCase is None:
+            continue
+
+        print(f"{formatCase(case)}, speed-up {case['scansPerSecond'] / baselineCase['scansPerSecond']:.2f}x, "
+              f"memory {case['peakMemoryBytes'] / baselineCase['peakMemoryBytes']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataProcessor throughput benchmark on synthetic scans")
+    parser.add_argument("--engines", nargs="+", default=list(benchmarkEngines.keys()),
+                        choices=list(benchmarkEngines.keys()))
+    parser.add_argument("--rates", nargs="+", type=int, default=list(range(len(MFLISamplingRates))),
+                        help="indices of MFLISamplingRates")
+    parser.add_argument("--lengths", nargs="+", type=float, default=list(defaultScanLengths),
+                        help="scan lengths [um]")
+    parser.add_argument("--speed", type=float, default=defaultScanSpeed, help="scan speed [mm/s]")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-samples", type=int, default=2 ** 23)
+    parser.add_argument("--window", default="hanning")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None, help="name of this run in comparisons")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="results of a previous run to compare with")
+    arguments = parser.parse_args()
+
+    results = runBenchmarks(arguments.engines, arguments.rates, arguments.lengths, arguments.speed,
+                            arguments.repeats, arguments.max_samples, arguments.window, arguments.seed)
+
+    output = {"label": arguments.label,
+              "revision": getGitRevision(),
+              "timestamp": datetime.now().isoformat(timespec="seconds"),
+              "platform": platform.platform(),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "scipy": scipy.__version__,
+              "apodizationWindow": arguments.window,
+              "repeats": arguments.repeats,
+              "results": results}
+
+    with open(arguments.output, "w") as fp:
+        json.dump(output, fp, indent=2)
+
+    print(f"Results saved to {arguments.output}")
+
+    if arguments.compare is not None:
+        with open(arguments.compare, "r") as fp:
+            compareResults(json.load(fp), output)
+
+
+if __name__ == "__main__":
+    main()
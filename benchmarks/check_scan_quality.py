@@ -0,0 +1,105 @@
+import argparse
+
+import numpy as np
+
+from scan_quality import ScanQualityGate
+from benchmarks.synthetic_interferogram import SyntheticInterferogramGenerator
+
+# run from the repository root:
+#   python -m benchmarks.check_scan_quality
+# checks the scan-quality gate on synthetic scans: clean records quantized by the ADC must pass, clipped records must
+# be flagged as saturated; clean slow scans sampled far above the fringe frequency must pass all of the checks
+
+samplingFrequencies = (6.0E7, 1.88E6, 2.93E4)    # [Hz], from the fastest to the slowest rate of the MFLI
+adcFullScale = 3.0                              # input range [V], symmetric
+adcResolutions = (12, 14, 16)                   # [bits]
+
+# slow scans: (scan speed [mm/s], scan length [um], sampling frequency [Hz]), from several fringes per block down to
+# about one fringe per block, and from thousands of samples per fringe down to tens
+slowScans = ((0.1, 500.0, 9.38E5), (0.1, 200.0, 1.88E6), (0.1, 200.0, 7.32E3), (0.5, 1000.0, 1.88E6))
+
+
+def quantize(signal, bits):
+    step = 2 * adcFullScale / 2 ** bits
+    return np.clip(np.round(signal / step) * step, -adcFullScale, adcFullScale - step)
+
+
+def generateScan(samplingFrequency, lowNoise, seed):
+    generator = SyntheticInterferogramGenerator(seed)
+
+    if lowNoise:
+        generator.referenceNoise = 0.0
+        generator.detectorNoise = 0.0
+
+    # the scan is shortened at fast rates to keep the records within a few million samples
+    scanLength = min(1000.0, 5.0E3 * 2.0E6 / samplingFrequency)
+    return generator.generateScan(samplingFrequency, scanLength, 5.0), generator
+
+
+def checkCases(gate):
+    failures = []
+
+    for samplingFrequency in samplingFrequencies:
+        for bits in adcResolutions:
+            for lowNoise in (True, False):
+                (reference, interferogram), generator = generateScan(samplingFrequency, lowNoise, seed=bits)
+                case = f"{samplingFrequency:.3g} Hz, {bits} bits, {'low' if lowNoise else 'normal'} noise"
+
+                # clean quantized record
+                quality = gate.check(quantize(reference, bits), quantize(interferogram, bits))
+                failures += reportCase(gate, f"clean, {case}", quality, expectSaturated=False)
+
+                # reference clipped 10% below its peak
+                clipLevel = generator.referenceOffset + 0.9 * generator.referenceAmplitude
+                quality = gate.check(quantize(np.minimum(reference, clipLevel), bits), quantize(interferogram, bits))
+                failures += reportCase(gate, f"clipped reference, {case}", quality, expectSaturated=True)
+
+                # ZPD burst clipped at half of its amplitude
+                clipLevel = generator.sourceOffset + 0.5 * generator.sourceAmplitude
+                quality = gate.check(quantize(reference, bits), quantize(np.minimum(interferogram, clipLevel), bits))
+                failures += reportCase(gate, f"clipped ZPD, {case}", quality, expectSaturated=True)
+
+    return failures
+
+
+def checkSlowScans(gate):
+    failures = []
+
+    for scanSpeed, scanLength, samplingFrequency in slowScans:
+        for seed in range(3):
+            generator = SyntheticInterferogramGenerator(seed)
+            reference, interferogram = generator.generateScan(samplingFrequency, scanLength, scanSpeed)
+            case = f"clean slow scan, {scanSpeed} mm/s, {scanLength:.0f} um, {samplingFrequency:.3g} Hz, seed {seed}"
+
+            quality = gate.check(quantize(reference, 16), quantize(interferogram, 16))
+            verdict = "ok" if len(quality["reasons"]) == 0 else "FAILED"
+            print(f"{verdict:6} {case}: {gate.formatQuality(quality)} {quality['reasons']}")
+
+            if len(quality["reasons"]) > 0:
+                failures.append(case)
+
+    return failures
+
+
+def reportCase(gate, case, quality, expectSaturated):
+    saturated = "saturated detector" in quality["reasons"]
+    verdict = "ok" if saturated == expectSaturated else "FAILED"
+    print(f"{verdict:6} {case}: {gate.formatQuality(quality)}")
+    return [] if saturated == expectSaturated else [case]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks of the scan-quality gate on synthetic scans")
+    parser.parse_args()
+
+    gate = ScanQualityGate()
+    failures = checkCases(gate) + checkSlowScans(gate)
+
+    if len(failures) > 0:
+        raise SystemExit(f"{len(failures)} cases failed")
+
+    print("All cases passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import time
+
+import numpy as np
+
+from data_processor import DataProcessor
+
+# run from the repository root:
+#   python -m benchmarks.check_spectral_grid
+# checks that the cached spectral grid interpolates a spectrum onto the common X axis the same way as the original
+# per-scan code (wavelength of every bin, nearest-value search of the crop bins and np.interp) on the full axis,
+# including mirror travels for which the short-wavelength end of the axis lies beyond the last valid bin
+
+scanLengths = (4096, 30000, 250000)
+tolerance = 1.0E-8      # [dB]
+
+
+def interpolateOriginal(spectrum_abs, mirror_travel_distance_total, K, common_spectrum_X, x_min, x_max):
+    # the interpolation on the common X axis as it was done before the spectral grid, with the bin loop vectorized
+    spectrum_x = np.arange(0, len(spectrum_abs), 1)
+    spectrum_x_recalc = np.zeros(len(spectrum_abs))
+    spectrum_x_recalc[1:] = (2 * mirror_travel_distance_total / spectrum_x[1:]) * K
+
+    spectrum_abs = spectrum_abs[1:len(spectrum_abs) - 2]
+    spectrum_x_recalc = spectrum_x_recalc[1:len(spectrum_x_recalc) - 2]
+
+    start_index = np.abs(spectrum_x_recalc - x_min).argmin()
+    stop_index = np.abs(spectrum_x_recalc - x_max).argmin()
+
+    axisXCut = np.flip(spectrum_x_recalc[stop_index:start_index])
+    axisYCut = np.flip(spectrum_abs[stop_index:start_index])
+
+    return np.interp(common_spectrum_X, axisXCut, axisYCut)
+
+
+def checkCases(dataProcessor, rng):
+    failures = []
+    gridSeconds = []
+    originalSeconds = []
+
+    for scanLength in scanLengths:
+        for shortEndFactor in (0.5, 1.0, 2.0):
+            # the mirror travel is chosen so that the last valid bin lies at shortEndFactor times the short end
+            # of the common axis, with a random offset of the travel from scan to scan
+            K = dataProcessor.getPaddedLength(scanLength) / scanLength
+            mirrorTravel = (shortEndFactor * dataProcessor.spectrum_config_x_min * (scanLength - 3) / (2.0 * K) *
+                            rng.uniform(0.99, 1.01))
+
+            grid = dataProcessor.getSpectralGrid(scanLength, mirrorTravel)
+            spectrum = rng.normal(-60.0, 5.0, scanLength)
+
+            start = time.perf_counter()
+            result = grid.interpolate(spectrum, mirrorTravel, out=np.empty(grid.pointsCount),
+                                      workspace=dataProcessor.workspace)
+            gridSeconds.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = interpolateOriginal(spectrum, mirrorTravel, grid.K, grid.commonX,
+                                           dataProcessor.spectrum_config_x_min, dataProcessor.spectrum_config_x_max)
+            originalSeconds.append(time.perf_counter() - start)
+
+            difference = float(np.max(np.abs(result - expected)))
+            case = f"scan length {scanLength}, mirror travel {mirrorTravel:.4g} um"
+            verdict = "ok" if difference <= tolerance else "FAILED"
+            print(f"{verdict:6} {case}: largest difference {difference:.3g} dB")
+
+            if difference > tolerance:
+                failures.append(case)
+
+    print(f"Interpolation on {dataProcessor.spectrum_config_pts} points: spectral grid "
+          f"{1E3 * np.median(gridSeconds):.1f} ms, original {1E3 * np.median(originalSeconds):.1f} ms (median)")
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check of the spectral grid against the original interpolation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = checkCases(DataProcessor(), np.random.default_rng(args.seed))
+
+    if len(failures) > 0:
+        raise SystemExit(f"{len(failures)} cases failed")
+
+    print("All cases passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class SyntheticInterferogramGenerator:
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+
+        self.ref_laser_wavelength = 1.547718    # um
+        self.referenceAmplitude = 1.0           # [V]
+        self.referenceOffset = 0.5              # [V]
+        self.referenceNoise = 1.0E-3            # rms [V]
+
+        # broadband THz source with a Gaussian spectrum in wavenumber
+        self.sourceCenterWavelength = 150.0     # um (2 THz)
+        self.sourceBandwidth = 0.003            # standard deviation of the spectrum [1/um] (0.9 THz)
+        self.sourceAmplitude = 0.1              # interferogram amplitude at the ZPD [V]
+        self.sourceOffset = 0.2                 # [V]
+        self.zpdPosition = 0.3                  # position of the ZPD as a fraction of the mirror travel
+
+        self.detectorNoise = 1.0E-4             # rms [V]
+
+        # mirror velocity jitter - sum of sinusoids with random phases, relative rms of the velocity
+        self.velocityJitter = 0.01
+        self.velocityJitterFrequencies = (3.0, 11.0, 27.0, 50.0)   # [Hz]
+
+    def generateScan(self, samplingFrequency, scanLength, scanSpeed):
+        # scanLength [um], scanSpeed [mm/s], samplingFrequency [Hz]; returns the reference and the interferogram
+        # signals of a single scan, sampled the same way as by the MFLI
+        velocity = scanSpeed * 1000  # [um/s]
+        samplesCount = int(np.ceil((scanLength / velocity) * samplingFrequency))
+        t = np.arange(samplesCount) / samplingFrequency
+
+        positions = velocity * t + self.generatePositionJitter(t, velocity)
+
+        reference = (self.referenceOffset +
+                     self.referenceAmplitude * np.cos(2 * np.pi * positions / (self.ref_laser_wavelength / 2)) +
+                     self.referenceNoise * self.rng.standard_normal(samplesCount))
+
+        # the interferogram of a Gaussian spectrum is a cosine at the center wavenumber with a Gaussian envelope,
+        # the optical path difference is twice the mirror displacement
+        opticalPath = 2 * (positions - self.zpdPosition * scanLength)
+        envelope = np.exp(-0.5 * (2 * np.pi * self.sourceBandwidth * opticalPath) ** 2)
+        interferogram = (self.sourceOffset +
+                         self.sourceAmplitude * envelope *
+                         np.cos(2 * np.pi * opticalPath / self.sourceCenterWavelength) +
+                         self.detectorNoise * self.rng.standard_normal(samplesCount))
+
+        return reference, interferogram
+
+    def generatePositionJitter(self, t, velocity):
+        # displacement caused by the velocity jitter, zero at the start of the scan
+        frequencies = np.asarray(self.velocityJitterFrequencies)
+        phases = self.rng.uniform(0, 2 * np.pi, len(frequencies))
+        # every component has the same amplitude, the rms of their sum is equal to velocityJitter
+        amplitude = velocity * self.velocityJitter * np.sqrt(2.0 / len(frequencies))
+
+        jitter = np.zeros(len(t))
+        for f, phase in zip(frequencies, phases):
+            jitter += amplitude / (2 * np.pi * f) * (np.sin(2 * np.pi * f * t + phase) - np.sin(phase))
+
+        return jitter
+
+    def getTrueSpectrum(self, wavelengths):
+        # spectrum of the source in dB relative to its peak
+        wavenumbers = 1.0 / np.asarray(wavelengths, dtype=float)
+        relativeWavenumbers = (wavenumbers - 1.0 / self.sourceCenterWavelength) / self.sourceBandwidth
+        return 10.0 * np.log10(np.e) * (-0.5 * relativeWavenumbers ** 2)
@@ -38,6 +38,21 @@ def save_to_csv_2columns(filePath, column1Header, column2Header, column1Data, co
             csvfile.writelines(dataLines)
 
 
+def save_to_csv_3columns(filePath, column1Header, column2Header, column3Header, column1Data, column2Data, column3Data):
+
+    if len(column1Data) != len(column2Data) or len(column1Data) != len(column3Data):
+        raise ValueError("Data columns have different sizes!")
+    else:
+        header = f"{column1Header},{column2Header},{column3Header}\n"
+        dataLines = [header]
+
+        for i in range(0, len(column1Data)):
+            dataLines.append("%f,%f,%f\n" % (column1Data[i], column2Data[i], column3Data[i]))
+
+        with open(filePath, 'a') as csvfile:
+            csvfile.writelines(dataLines)
+
+
 def exportAllDataAbsorbance(refX, refY, sampleX, sampleY, absX, absY,
                             absXTitle, absYTitle, absTitle,
                             rngXMin, rngXMax, rngYMin, rngYMax, rngAbsYMin, rngAbsYMax):
@@ -174,7 +189,8 @@ def exportSpectrumAsCSV(spectrumX, spectrumY):
 def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
                                       rawSpectraX, rawSpectraY,
                                       correctedInterferogramsX, correctedInterferogramsY,
-                                      interferogramsRaw, referenceSignalsRaw, settings, comments):
+                                      interferogramsRaw, referenceSignalsRaw, settings, comments,
+                                      averageSpectrumBand=None, backwardScans=None):
 
     direcotry_selected = filedialog.askdirectory()
     packageNameDialog = ctk.CTkInputDialog(text="Type in a short name for the data package", title="Name your results")
@@ -193,6 +209,7 @@ def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
     os.mkdir(savePackageRootPath)
 
     pathToSpectrumCSV = os.path.join(savePackageRootPath, "spectrum.csv")
+    pathToSpectrumBandCSV = os.path.join(savePackageRootPath, "spectrum_band.csv")
     pathToInterferogramCSV = os.path.join(savePackageRootPath, "interferogram.csv")
     pathToSpectrumPicture = os.path.join(savePackageRootPath, "spectrum.png")
     pathToInterferogramPicture = os.path.join(savePackageRootPath, "interferogram.png")
@@ -229,6 +246,7 @@ def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
             os.mkdir(pathToRawDataDirectory)
 
     averageSpectrumDataValid = False
+    averageSpectrumBandValid = False
     rawSpectraDataValid = False
     interferogramDataValid = False
     rawDataValid = False
@@ -244,6 +262,14 @@ def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
                              "Wavelength [um]", "Intensity [dBm]",
                              averageSpectrumX, averageSpectrumY)
 
+        # uncertainty band of the average spectrum (+/- standard error of every bin)
+        if averageSpectrumBand is not None and len(averageSpectrumBand[0]) == len(averageSpectrumX):
+            averageSpectrumBandValid = True
+
+            save_to_csv_3columns(pathToSpectrumBandCSV,
+                                 "Wavelength [um]", "Lower bound [dBm]", "Upper bound [dBm]",
+                                 averageSpectrumX, averageSpectrumBand[0], averageSpectrumBand[1])
+
         mpl.rcParams.update(mpl.rcParamsDefault)
         plt.figure(figsize=(12.5, 7.5))
         plt.tight_layout()
@@ -254,6 +280,8 @@ def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
         plt.xlabel("Wavelength [\u03BCm]", fontsize=20)
         plt.ylabel("Intensity [dBm]", fontsize=20)
         plt.plot(averageSpectrumX, averageSpectrumY)
+        if averageSpectrumBandValid:
+            plt.fill_between(averageSpectrumX, averageSpectrumBand[0], averageSpectrumBand[1], alpha=0.3, linewidth=0)
         # plt.yscale('log')
         plt.xlim((float(settings["plotSpectrumXRangeMin"]), float(settings["plotSpectrumXRangeMax"])))
         plt.ylim((float(settings["plotSpectrumYRangeMin"]), float(settings["plotSpectrumYRangeMax"])))
@@ -339,7 +367,13 @@ def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
     if averageSpectrumDataValid and saveToMATFlag:
         pathToAverageSpectrumMat = os.path.join(pathToMatlabSubDirectory, f"spectrumAverage.mat")
         spectrum_structure = np.array([averageSpectrumX, averageSpectrumY], dtype=[('Wavelength', 'f'), ('Intensity', 'f')])
-        scipy.io.savemat(pathToAverageSpectrumMat, {"Average spectrum":spectrum_structure})
+        mdic = {"Average spectrum":spectrum_structure}
+
+        if averageSpectrumBandValid:
+            mdic["Average spectrum band"] = np.array([averageSpectrumX, averageSpectrumBand[0], averageSpectrumBand[1]],
+                                                     dtype=[('Wavelength', 'f'), ('Lower', 'f'), ('Upper', 'f')])
+
+        scipy.io.savemat(pathToAverageSpectrumMat, mdic)
 
     # .mat corrected interferograms
     if interferogramDataValid and saveRawData and saveToMATFlag:
@@ -387,12 +421,17 @@ def exportAllDataMultipleMeasurements(averageSpectrumX, averageSpectrumY,
             f.write(f"instrument:Experimental THz FTS\n")
             f.write(f"data_type:Basic FTS spectrum\n")
             f.write(f"average_spectrum_data_included:{averageSpectrumDataValid}\n")
+            f.write(f"average_spectrum_band_included:{averageSpectrumBandValid}\n")
             f.write(f"raw_spectra_data_included:{rawSpectraDataValid}\n")
             f.write(f"interferogram_data_included:{interferogramDataValid}\n")
             f.write(f"raw_data_included:{rawDataValid}\n")
             f.write(f"name:{selectedName}\n")
             f.write(f"timestamp:{timestamp}\n")
 
+            # raw data are saved as acquired, scans of the return sweep are reversed in time by the processing
+            if backwardScans is not None:
+                f.write(f"scan_directions:{','.join('backward' if b else 'forward' for b in backwardScans)}\n")
+
             for key in settings.keys():
                 f.write(f"{key}:{settings[key]}\n")
 
@@ -1,217 +1,894 @@
+import contextlib
+import functools
+import time
 import numpy as np
 from scipy.signal import find_peaks
 from scipy import signal
-from scipy.signal import hilbert
+from scipy import fft as scipy_fft
+from scipy import special
+
+
+def nortonBeerWindow(length, coefficients):
+    # Norton-Beer window: sum of C_i * (1 - x^2)^i over x from -1 to 1
+    x = np.linspace(-1.0, 1.0, length)
+    return np.polynomial.polynomial.polyval(1.0 - x ** 2, coefficients)
+
+
+# all available apodization windows: name -> (window function, extra parameters of the function, asymmetric flag),
+# window functions are called as function(length, *parameters) and return a symmetric window of the given length;
+# asymmetric windows are built from two such windows so that their maximum matches the ZPD of the interferogram
+apodizationWindowsRegistry = {}
+
+
+def registerApodizationWindow(name, windowFunction, parameters=(), asymmetric=True):
+    apodizationWindowsRegistry[name] = (windowFunction, tuple(parameters), asymmetric)
+    getSymmetricApodizationWindow.cache_clear()
 
 
 def getApodizationWindowsTypesList():
+    return list(apodizationWindowsRegistry.keys())
+
+
+# numeric precision of the processing chain: name -> (real type, complex type)
+processingPrecisions = {
+    "float64": (np.float64, np.complex128),
+    "float32": (np.float32, np.complex64),
+}
+
+
+def getProcessingPrecisionsList():
+    return list(processingPrecisions.keys())
+
+
+def getProcessingAlgorithmsList():
     return [
-    "boxcar",
-    "hanning",
-    "triangular",
-    "blackman-harris",
-    "gauss",
-    "tukey_0.1",
-    "tukey_0.2",
-    "tukey_0.5",
+    "hilbert",
+    "nufft",
+    "fringes",
+    "zoom",
 ]
 
-class DataProcessor:
+
+def getAveragingModesList():
+    return [
+    "spectrum",
+    "power",
+    "coherent",
+]
+
+
+def getAveragingStatisticsList():
+    return [
+    "mean",
+    "sigma clipping",
+    "median",
+]
+
+
+def getZeroPaddingPoliciesList():
+    return [
+    "fixed",
+    "adaptive",
+]
+
+
+def convertWattsToDBm(spectrum, out=None):
+    # 'out' may be the input array itself
+    result = np.multiply(spectrum, 1.0E3, out=out)
+    np.log10(result, out=result)
+    result *= 10.0
+    return result
+
+
+def getPhaseExtractionMethodsList():
+    return [
+    "hilbert",
+    "iq",
+]
+
+
+def buildApodizationWindow(windowFunction, parameters, length, zpdIdx, dtype=np.float64):
+    if zpdIdx is None:
+        window = windowFunction(length, *parameters)
+    else:
+        winLeft = windowFunction((zpdIdx + 1) * 2, *parameters)
+        winLeft = winLeft[:int(len(winLeft) / 2)]
+        winRight = windowFunction(((length - 1) - zpdIdx) * 2, *parameters)
+        winRight = winRight[int(len(winRight) / 2):]
+        window = np.concatenate((winLeft, winRight))
+
+    window = window.astype(dtype, copy=False)
+
+    # the window may be shared between scans, so it must not be modified
+    window.flags.writeable = False
+    return window
+
+
+@functools.lru_cache(maxsize=4)
+def getSymmetricApodizationWindow(windowType, length, dtype=np.float64):
+    # symmetric windows depend only on the length of the interferogram, so they are reused between scans
+    windowFunction, parameters, _ = apodizationWindowsRegistry[windowType]
+    return buildApodizationWindow(windowFunction, parameters, length, None, dtype)
+
+
+def getApodizationWindow(windowType, length, zpdIdx, dtype=np.float64):
+    windowFunction, parameters, asymmetric = apodizationWindowsRegistry[windowType]
+
+    if not asymmetric:
+        return getSymmetricApodizationWindow(windowType, length, dtype)
+
+    # the ZPD moves from scan to scan, a cache of asymmetric windows would hold full-length windows without hits
+    return buildApodizationWindow(windowFunction, parameters, length, zpdIdx, dtype)
+
+
+registerApodizationWindow("boxcar", signal.windows.boxcar, asymmetric=False)
+registerApodizationWindow("hanning", signal.windows.hann)
+registerApodizationWindow("triangular", signal.windows.triang)
+registerApodizationWindow("blackman-harris", signal.windows.blackmanharris)
+registerApodizationWindow("gauss", signal.windows.gaussian, parameters=(7,))
+registerApodizationWindow("tukey_0.1", signal.windows.tukey, parameters=(0.1,))
+registerApodizationWindow("tukey_0.2", signal.windows.tukey, parameters=(0.2,))
+registerApodizationWindow("tukey_0.5", signal.windows.tukey, parameters=(0.5,))
+registerApodizationWindow("nb_weak", nortonBeerWindow, parameters=((0.384093, -0.087577, 0.703484),))
+registerApodizationWindow("nb_medium", nortonBeerWindow, parameters=((0.152442, -0.136176, 0.983734),))
+registerApodizationWindow("nb_strong", nortonBeerWindow, parameters=((0.045335, 0.0, 0.554883, 0.0, 0.399782),))
+
+
+class SpectrumWorkspace:
 
     def __init__(self):
-        print("DataProcessor created")
+        # named buffers reused between calls, a buffer is reallocated only when the requested shape or type changes
+        self.buffers = {}
+
+    def get(self, name, shape, dtype):
+        buffer = self.buffers.get(name)
+
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+
+        return buffer
+
+
+class SpectralGrid:
+
+    def __init__(self, xMin, xMax, pointsCount, K, scanLength):
+        self.xMin = xMin
+        self.xMax = xMax
+        self.pointsCount = pointsCount
+        self.K = K
+        self.scanLength = scanLength
+
+        # common X axis shared by all spectra, stored in the descending order expected by the GUI
+        commonX = np.ascontiguousarray(np.flip(np.linspace(start=xMin, stop=xMax, num=pointsCount, endpoint=True)))
+        commonX.flags.writeable = False
+        self.commonX = commonX
+
+        # interpolation plan - bin k of the padded spectrum corresponds to the wavelength 2 * D * K / k, where D is
+        # the mirror travel, so the wavelength axis of the bins divided by D is the same for all scans; it is kept in
+        # the ascending order of wavelengths (descending bins) expected by np.interp
+        self.firstValidBin = 1
+        self.lastValidBin = scanLength - 3
+        binWavelengthsPerTravel = 2.0 * K / np.arange(self.lastValidBin, 0, -1, dtype=np.float64)
+        binWavelengthsPerTravel.flags.writeable = False
+        self.binWavelengthsPerTravel = binWavelengthsPerTravel
+
+    def nearestBin(self, mirrorTravel, wavelength):
+        # closed-form equivalent of a linear nearest-value search over the wavelength axis of the valid bins
+        # (the DC bin and the last two bins of the spectrum are cut off)
+        exactBin = 2.0 * mirrorTravel * self.K / wavelength
+        lowerBin = min(max(int(np.floor(exactBin)), self.firstValidBin), self.lastValidBin)
+        upperBin = min(lowerBin + 1, self.lastValidBin)
+        lowerError = abs(2.0 * mirrorTravel * self.K / lowerBin - wavelength)
+        upperError = abs(2.0 * mirrorTravel * self.K / upperBin - wavelength)
+
+        if upperError < lowerError:
+            return upperBin
+        else:
+            return lowerBin
+
+    def cropBins(self, mirrorTravel):
+        # returns bins corresponding to the long and to the short end of the common axis; the bin nearest to the
+        # short end is left out, the same as in the original slicing of the wavelength axis
+        startBin = self.nearestBin(mirrorTravel, self.xMax)
+        stopBin = max(self.nearestBin(mirrorTravel, self.xMin) - 1, startBin)
+        return startBin, stopBin
+
+    def interpolate(self, spectrumY, mirrorTravel, out=None, workspace=None):
+        # linear interpolation (in wavelength) of a spectrum indexed by bin number onto the common axis, values
+        # beyond the cropped bins are held at the edge bins; the result is written to 'out' if given
+        startBin, stopBin = self.cropBins(mirrorTravel)
+        firstIdx = self.lastValidBin - stopBin
+        binsCount = stopBin + 1 - startBin
+
+        if workspace is None:
+            binWavelengths = np.empty(binsCount)
+        else:
+            binWavelengths = workspace.get("binWavelengths", (binsCount,), np.float64)
 
-        self.ref_laser_wavelength = 1.547718 #um
-        self.K = 8 # zero-padding factor
-        self.detector_sensitivity = 7.0E4 # [V/W]
+        np.multiply(self.binWavelengthsPerTravel[firstIdx:firstIdx + binsCount], mirrorTravel, out=binWavelengths)
+        binValues = spectrumY[stopBin:startBin - 1:-1]
 
-    def analyzeData(self, rawReferenceSignal, rawInterferogram):
-        print("Analyzing data")
-        detector_sensitivity = 7.0E4 # [V/W]
+        spectrum = np.interp(self.commonX, binWavelengths, binValues)
 
-        ref_volt = rawReferenceSignal - np.mean(rawReferenceSignal)
-        meas_volt = rawInterferogram - np.mean(rawInterferogram)
+        if out is None:
+            return spectrum.astype(spectrumY.dtype, copy=False)
 
-        # normalize reference interferometer signal
-        ref_volt = (ref_volt - np.min(ref_volt)) / (np.max(ref_volt) - np.min(ref_volt))
+        np.copyto(out, spectrum, casting="unsafe")
+        return out
 
-        # find peaks
-        ref_pos_peaks, _ = find_peaks(ref_volt, prominence=0.075)
-        ref_pos_peaks_neg, _ = find_peaks(-ref_volt, prominence=0.075)
 
-        ref_pos_peaks = np.concatenate((ref_pos_peaks, ref_pos_peaks_neg))
-        ref_pos_peaks.sort(kind='mergesort')
+def interpolateRows(x, xp, fp):
+    # row-wise np.interp for 2-D arrays done in a single call - every row is shifted to a separate, non-overlapping
+    # range of X values, all x values have to lie within the range of xp of the corresponding row
+    xpMin = np.min(xp, axis=-1, keepdims=True)
+    rowSpan = np.max(xp - xpMin) + 1.0
+    rowOffsets = xpMin - rowSpan * np.arange(xp.shape[0]).reshape(-1, 1)
+
+    result = np.interp((x - rowOffsets).reshape(-1), (xp - rowOffsets).reshape(-1), fp.reshape(-1))
+    return result.reshape(x.shape)
+
+
+@functools.lru_cache(maxsize=4)
+def getZoomSpectralAxis(xMin, xMax, pointsCount):
+    # evenly spaced spatial frequencies [1/um of mirror travel] covering wavelengths from xMin to xMax [um],
+    # returned together with the corresponding (descending) wavelengths
+    spatialFrequencies = np.linspace(start=2.0 / xMax, stop=2.0 / xMin, num=pointsCount, endpoint=True)
+    wavelengths = 2.0 / spatialFrequencies
+    spatialFrequencies.flags.writeable = False
+    wavelengths.flags.writeable = False
+    return spatialFrequencies, wavelengths
+
+
+@functools.lru_cache(maxsize=2)
+def getZoomTransform(inputLength, xMin, xMax, pointsCount, sampleSpacing):
+    # chirp-z transform of an interferogram sampled every sampleSpacing [um] onto the zoom spectral axis, building
+    # its chirp tables takes longer than the transform itself, so the plan is shared by all scans resampled with the
+    # same spacing and length; every plan holds a few complex arrays of the padded transform length
+    spatialFrequencies, _ = getZoomSpectralAxis(xMin, xMax, pointsCount)
+
+    # points on the unit circle: z_k = a * w^-k = exp(2j * pi * f_k * dx)
+    frequencyStep = spatialFrequencies[1] - spatialFrequencies[0]
+    a = np.exp(2j * np.pi * spatialFrequencies[0] * sampleSpacing)
+    w = np.exp(-2j * np.pi * frequencyStep * sampleSpacing)
+
+    return signal.CZT(inputLength, m=pointsCount, w=w, a=a)
+
+
+@functools.lru_cache(maxsize=4)
+def getSpectralGrid(xMin, xMax, pointsCount, K, scanLength):
+    return SpectralGrid(xMin, xMax, pointsCount, K, scanLength)
+
+
+def kaiserBesselKernel(x, width, beta):
+    # Kaiser-Bessel gridding kernel, x in grid samples, zero outside of |x| <= width / 2
+    argument = 1.0 - (2.0 * x / width) ** 2
+    return np.where(argument > 0, special.i0(beta * np.sqrt(np.maximum(argument, 0.0))), 0.0)
+
+
+@functools.lru_cache(maxsize=4)
+def kaiserBesselKernelTable(width, beta, resolution=1024):
+    # kernel tabulated from -width / 2 to width / 2 with the given number of points per grid sample
+    table = kaiserBesselKernel(np.linspace(-width / 2, width / 2, width * resolution + 1), width, beta)
+    table = np.append(table, 0.0)
+    table.flags.writeable = False
+    return table
+
+
+def kaiserBesselKernelTransform(frequency, width, beta):
+    # continuous Fourier transform of the Kaiser-Bessel kernel, frequency in cycles per grid sample
+    argument = np.sqrt((beta ** 2 - (np.pi * width * frequency) ** 2).astype(complex))
+    return np.real(width * np.sinh(argument) / argument)
+
 
-        # resample the interferograms
-        mirror_travel_distance_total = self.ref_laser_wavelength / 4 * len(ref_pos_peaks)
-        print("Total REF mirror travel = ", mirror_travel_distance_total, "\u03BCm")
+class FFTPlanner:
 
-        # create an array for the new interferogram
-        resampled_interferogram = np.zeros(len(meas_volt))
+    def __init__(self, backend="scipy", workers=-1):
+        # backend: "numpy" (numpy.fft) or "scipy" (scipy.fft, can use multiple workers, -1 = all CPU cores)
+        self.backend = backend
+        self.workers = workers
 
-        # this array will hold position of the mirror for each index in um
-        resampled_X = np.zeros(len(ref_volt))
+    def fastLength(self, n, real=False):
+        # smallest length >= n for which the transform is fast (no large prime factors)
+        return scipy_fft.next_fast_len(int(n), real=real)
 
-        um_per_ref_peak = self.ref_laser_wavelength / 4
+    def paddedLength(self, n, K):
+        return self.fastLength(int(K * n), real=True)
 
-        # populate the new x axis with known positions (indices corresponding to ref peaks)
-        for i in range(0, len(ref_pos_peaks)):
-            resampled_X[ref_pos_peaks[i]] = i * um_per_ref_peak
+    def rfft(self, x, n=None):
+        if self.backend == "scipy":
+            return scipy_fft.rfft(x, n=n, axis=-1, workers=self.workers)
+        else:
+            return np.fft.rfft(x, n=n, axis=-1)
+
+    def ifft(self, x, n=None):
+        if self.backend == "scipy":
+            return scipy_fft.ifft(x, n=n, axis=-1, workers=self.workers)
+        else:
+            return np.fft.ifft(x, n=n, axis=-1)
+
+    def analyticSignal(self, x):
+        # analytic signal along the last axis (same as scipy.signal.hilbert); the transforms have the length of
+        # the input, padding to a fast length would change the result. Acquired records already have a fast length
+        n = x.shape[-1]
+
+        halfSpectrum = self.rfft(x)
+
+        # double positive frequencies, keep DC and (for even lengths) the Nyquist bin
+        halfSpectrum[..., 1:(n + 1) // 2] *= 2.0
 
-        new_x = np.linspace(0, len(resampled_X), num=len(resampled_X)).astype(int)
-        resampled_X = np.interp(new_x, new_x[resampled_X > 0], resampled_X[resampled_X > 0])
+        return self.ifft(halfSpectrum, n=n)
 
-        # create new X axis with evenly spaced x points
-        equ_dist_pts_cnt = len(meas_volt)
-        equ_pts_spacing = mirror_travel_distance_total / equ_dist_pts_cnt
-        equidistant_x_axis = np.zeros(equ_dist_pts_cnt)
-        equidistant_y_axis = np.zeros(equ_dist_pts_cnt)
 
-        for i in range(0, len(equidistant_x_axis)):
-            equidistant_x_axis[i] = i * equ_pts_spacing
+class ScanPipelineCache:
 
-        equidistant_y_axis = np.interp(equidistant_x_axis, resampled_X, meas_volt)
-        # zero-padding
-        np_pad_zeros = np.zeros(int(((self.K - 1) * len(meas_volt))))
-        meas_volt_padded = np.concatenate((equidistant_y_axis, np_pad_zeros))
+    def __init__(self):
+        # results of the processing stages of a single scan: stage name -> (settings key, result); a stage is
+        # reused only if it was calculated with the same settings, keys of later stages include the keys of the
+        # earlier ones, so a change of any setting invalidates all stages downstream of it
+        self.stages = {}
+
+    def get(self, stage, key):
+        entry = self.stages.get(stage)
+
+        if entry is not None and entry[0] == key:
+            return entry[1]
 
-        # calculate spectrum
-        spectrum_x = np.arange(0, len(meas_volt), 1)
-        spectrum = np.fft.fft(meas_volt_padded)
+        return None
 
-        # cut spectrum to match the correct X axis (required due to padding)
-        spectrum = spectrum[0:len(spectrum_x) - 1]
-        # calculate absolute value from the spectrum
-        spectrum_abs = np.abs(spectrum)
+    def set(self, stage, key, result):
+        self.stages[stage] = (key, result)
 
-        #normalize
-        # spectrum_abs = (spectrum_abs-np.min(spectrum_abs))/(np.max(spectrum_abs)-np.min(spectrum_abs))
-        spectrum_abs = spectrum_abs / (len(spectrum_abs) / 2)
-        # convert Y axis from volts to watts
-        spectrum_abs = spectrum_abs / detector_sensitivity
-        # conver Y axis from watts to dBm
-        spectrum_abs = 10.0 * np.log10(1.0E3 * spectrum_abs)
+    def clear(self):
+        self.stages = {}
 
-        # convert k to wavelength in um
-        spectrum_x_recalc = np.zeros(len(spectrum_abs))
 
-        for i in range(1, len(spectrum_abs)):
-            spectrum_x_recalc[i] = (2 * mirror_travel_distance_total / spectrum_x[i]) * self.K
+class StageTimer:
 
-        #cut the important part
-        spectrum_slicing_index_start = 1
-        spectrum_slicing_index_stop = len(spectrum_abs) - 2
+    def __init__(self):
+        # wall time and array size of every processing stage of the current call: name -> {"seconds", "samples"}
+        self.stages = {}
+        # the same aggregated over a run: name -> {"calls", "seconds", "maxSeconds", "samples"}
+        self.runStages = {}
+        self.runCallsCount = 0
+
+    @contextlib.contextmanager
+    def measure(self, name, samplesCount):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "samples": 0})
+            stage["seconds"] += time.perf_counter() - start
+            stage["samples"] = int(samplesCount)
+
+    def startCall(self):
+        # drop stages left over by an interrupted call
+        self.stages = {}
+
+    def finishCall(self):
+        # returns timings of the stages measured since the previous call and adds them to the run totals
+        timings = self.stages
+        self.stages = {}
+        self.addTimings(timings)
+        return timings
+
+    def addTimings(self, timings):
+        # adds timings of a single call (also measured elsewhere, e.g. in a worker process) to the run totals
+        for name, stage in timings.items():
+            total = self.runStages.setdefault(name, {"calls": 0, "seconds": 0.0, "maxSeconds": 0.0, "samples": 0})
+            total["calls"] += 1
+            total["seconds"] += stage["seconds"]
+            total["maxSeconds"] = max(total["maxSeconds"], stage["seconds"])
+            total["samples"] = stage["samples"]
+
+        self.runCallsCount += 1
+
+    def resetRun(self):
+        self.stages = {}
+        self.runStages = {}
+        self.runCallsCount = 0
+
+    def getRunSummary(self):
+        # one line per stage: mean and maximum time per call and share of the total processing time
+        if self.runCallsCount == 0:
+            return []
+
+        totalSeconds = self.runStages.get("total", {}).get("seconds", 0.0)
+        lines = []
+
+        for name, stage in sorted(self.runStages.items(), key=lambda item: -item[1]["seconds"]):
+            share = 100.0 * stage["seconds"] / totalSeconds if totalSeconds > 0 else 0.0
+            lines.append(f"{name}: {1E3 * stage['seconds'] / stage['calls']:.1f} ms/call "
+                         f"(max {1E3 * stage['maxSeconds']:.1f} ms, {share:.0f}%, {stage['samples']} samples)")
+
+        return lines
+
+    def getMeanSeconds(self, name="total"):
+        stage = self.runStages.get(name)
+        return stage["seconds"] / stage["calls"] if stage else None
+
+    def getDominantStage(self):
+        stages = [(stage["seconds"], name) for name, stage in self.runStages.items() if name != "total"]
+        return max(stages)[1] if stages else None
 
-        spectrum_abs = spectrum_abs[spectrum_slicing_index_start : spectrum_slicing_index_stop]
-        spectrum_x_recalc = spectrum_x_recalc[spectrum_slicing_index_start : spectrum_slicing_index_stop]
 
-        output = {"spectrumX": spectrum_x_recalc,
-                  "spectrumY": spectrum_abs,
-                  "interferogramX": equidistant_x_axis,
-                  "interferogramY": equidistant_y_axis}
+class DataProcessor:
 
+    def __init__(self):
+        print("DataProcessor created")
+
+        self.ref_laser_wavelength = 1.547718 #um
+        self.K = 8 # zero-padding factor
+
+        # zero-padding policy: "fixed" (always K) or "adaptive" - the factor is chosen for every scan so that the
+        # spectrum has paddingTargetPointsCount bins within the plotted band (zoomRangeMin - zoomRangeMax), or, if
+        # paddingInterpolationDensity is set, that many bins per point of the common X axis at the long-wavelength
+        # end of the band; the padded transform of a single scan is limited to paddingMemoryLimit bytes
+        self.paddingPolicy = "fixed"
+        self.paddingTargetPointsCount = 2 ** 12
+        self.paddingInterpolationDensity = None
+        self.paddingMinimalFactor = 2   # only the first scanLength bins of the padded spectrum are used
+        self.paddingMemoryLimit = 2 ** 30
+        self.detector_sensitivity = 7.0E4 # [V/W]
+
+        # configuration of the X axis common to all spectra
+        self.spectrum_config_x_min = 0.1
+        self.spectrum_config_x_max = 300.0
+        self.spectrum_config_pts = int(2E6)
+
+        # decimation of the raw records - sampling frequency [Hz] and mirror speed [mm/s] of the acquisition, both
+        # channels are decimated by the largest integer factor that keeps decimationSamplesPerPeriod samples per
+        # period of the reference fringes and of the shortest wavelength of the plotted band (twice the Nyquist rate
+        # would be enough in theory, the margin is needed by the anti-aliasing filter and the linear resampling);
+        # the decimation is disabled as long as any of the acquisition parameters is None
+        self.samplingFrequency = None
+        self.scanSpeed = None
+        self.decimationSamplesPerPeriod = 8
+
+        # number of scans transformed together by the batch processing
+        self.batchChunkSize = 8
+
+        # FFT lengths and backend
+        self.fftPlanner = FFTPlanner()
+
+        # precision of the resampling, apodization, FFT and dBm conversion; the mirror position retrieved from the
+        # reference signal is always calculated in float64. In the float32 mode spectra stay within 0.05 dB of the
+        # float64 results for bins down to 60 dB below the spectral peak, deeper bins approach the rounding noise floor
+        self.precision = None
+        self.realType = None
+        self.complexType = None
+        self.setPrecision("float64")
+
+        # method used to retrieve the instantaneous phase of the reference signal: "hilbert" (full-length analytic
+        # signal) or "iq" (narrowband IQ demodulation at the fringe frequency, low-pass filtering and decimation)
+        self.phaseExtractionMethod = "hilbert"
+        self.fringeEstimationLength = 2 ** 16  # samples used to estimate the fringe frequency
+        self.iqMinimalDecimation = 4  # IQ demodulation falls back to the Hilbert transform below this decimation
+        # IQ demodulation falls back to the Hilbert transform if the residual phase changes more than this between
+        # two decimated samples [rad], its unwrapping is not reliable then
+        self.iqMaximalPhaseStep = np.pi / 2
+
+        # algorithm used by analyze(), see getProcessingAlgorithmsList()
+        self.processingAlgorithm = "hilbert"
+        self.nufftKernelWidth = 6  # width of the Kaiser-Bessel gridding kernel in grid samples
+        self.nufftChunkLength = 2 ** 16  # samples gridded at once, limits the size of the temporary arrays
+
+        # zoom spectrum - band [um] and number of points evaluated with the chirp-z transform,
+        # the band defaults to the range of the common spectrum X axis
+        self.zoomRangeMin = None
+        self.zoomRangeMax = None
+        self.zoomPointsCount = 2 ** 16
+        # sample spacing and length of the resampled interferogram are rounded to this number of steps per octave,
+        # so that scans of slightly different speed and length share the chirp-z transform plan
+        self.zoomQuantizationSteps = 16
+
+        # unit of the calculated spectra: "dBm" or "W" (linear, used by the power averaging)
+        self.spectrumUnit = "dBm"
+
+        # buffers of the post-FFT stages (magnitude, scaling, unit conversion, interpolation on the common axis),
+        # allocated on the first scan and reused as long as the configuration does not change
+        self.workspace = SpectrumWorkspace()
+
+        # wall time of the processing stages, returned with every result under the "timings" key
+        self.stageTimer = StageTimer()
+
+    def analyze(self, rawReferenceSignal, rawInterferogram, apodizationWindowType, out=None, cache=None,
+                backwardScan=False):
+        # with a ScanPipelineCache of the scan only the stages affected by changed settings are recalculated;
+        # backwardScan - the scan was acquired on the return sweep of the delay line
+        self.stageTimer.startCall()
+
+        with self.stageTimer.measure("total", len(rawInterferogram)):
+            rawReferenceSignal, rawInterferogram = self.decimateScan(rawReferenceSignal, rawInterferogram, cache)
+
+            if backwardScan:
+                rawReferenceSignal, rawInterferogram = self.reverseScan(rawReferenceSignal, rawInterferogram)
+
+            if self.processingAlgorithm == "nufft":
+                output = self.analyzeDataNUFFT(rawReferenceSignal, rawInterferogram, apodizationWindowType, out,
+                                               cache)
+            elif self.processingAlgorithm == "fringes":
+                output = self.analyzeData(rawReferenceSignal, rawInterferogram, apodizationWindowType, out, cache)
+            elif self.processingAlgorithm == "zoom":
+                output = self.analyzeDataZoomFFT(rawReferenceSignal, rawInterferogram, apodizationWindowType, out,
+                                                 cache)
+            else:
+                output = self.analyzeDataHilbertInterpolation(rawReferenceSignal, rawInterferogram,
+                                                              apodizationWindowType, out, cache)
+
+        output["timings"] = self.stageTimer.finishCall()
         return output
 
+    def processInto(self, rawReferenceSignal, rawInterferogram, apodizationWindowType, out, cache=None,
+                    backwardScan=False):
+        # same as analyze(), the spectrum Y axis is written to a preallocated array of getSpectrumLength() points
+        if out.shape != (self.getSpectrumLength(),):
+            raise ValueError(f"Output array must have {self.getSpectrumLength()} points")
+
+        return self.analyze(rawReferenceSignal, rawInterferogram, apodizationWindowType, out, cache, backwardScan)
+
+    def runStage(self, cache, stage, key, calculate):
+        # result of a processing stage, taken from the scan cache if it was calculated with the same settings
+        if cache is not None:
+            result = cache.get(stage, key)
+
+            if result is not None:
+                return result
+
+        result = calculate()
+
+        if cache is not None:
+            cache.set(stage, key, result)
+
+        return result
+
+    def getDecimationFactor(self):
+        if self.samplingFrequency is None or self.scanSpeed is None:
+            return 1
+
+        # the optical path difference changes at twice the mirror speed, a period of the signal corresponds to the
+        # wavelength of the reference laser or of the short-wavelength end of the band, whichever is shorter
+        rangeMin, _ = self.getBandRange()
+        highestFrequency = 2.0 * self.scanSpeed * 1E3 / min(self.ref_laser_wavelength, rangeMin)
+
+        return max(int(self.samplingFrequency / (self.decimationSamplesPerPeriod * highestFrequency)), 1)
+
+    def decimateScan(self, rawReferenceSignal, rawInterferogram, cache=None):
+        # both channels decimated with a polyphase anti-aliasing filter along the last axis
+        factor = self.getDecimationFactor()
+
+        if factor == 1:
+            return rawReferenceSignal, rawInterferogram
+
+        def calculate():
+            with self.stageTimer.measure("decimation", np.size(rawInterferogram)):
+                return (signal.resample_poly(rawReferenceSignal, 1, factor, axis=-1, padtype="mean"),
+                        signal.resample_poly(rawInterferogram, 1, factor, axis=-1, padtype="mean"))
+
+        return self.runStage(cache, "decimated", factor, calculate)
+
+    def reverseScan(self, rawReferenceSignal, rawInterferogram):
+        # the phase retrieved from the reference grows with the mirror travel in both directions, so the record of
+        # a return sweep has its own position axis x running from the far end of the scan; reversed in time, the
+        # record gets the axis D - x (D - total travel) and lies on the optical path axis of the forward sweeps
+        return np.flip(rawReferenceSignal, axis=-1), np.flip(rawInterferogram, axis=-1)
+
+    def getMirrorPositionMethod(self):
+        # method of the mirror position retrieval used by the selected algorithm
+        return "fringes" if self.processingAlgorithm == "fringes" else self.phaseExtractionMethod
+
+    def getMirrorPositionKey(self, method):
+        return (method, self.ref_laser_wavelength, self.getDecimationFactor())
+
+    def isScanCached(self, cache):
+        # the mirror position (and the decimated records) of the scan are in its cache for the current settings,
+        # the remaining stages are cheaper than passing the scan to a worker process
+        factor = self.getDecimationFactor()
+        method = self.getMirrorPositionMethod()
+
+        if factor > 1 and cache.get("decimated", factor) is None:
+            return False
+
+        return cache.get("positions", self.getMirrorPositionKey(method)) is not None
+
+    def getMirrorPosition(self, rawReferenceSignal, method, cache=None):
+        # mirror position for every sample retrieved with the given method ("fringes", "hilbert" or "iq"),
+        # returned together with the key of the stage
+        key = self.getMirrorPositionKey(method)
+
+        def calculate():
+            ref_volt = rawReferenceSignal - np.mean(rawReferenceSignal)
+
+            if method == "fringes":
+                with self.stageTimer.measure("fringes", len(ref_volt)):
+                    return self.calculateMirrorPositionFromFringes(ref_volt)
+
+            return self.calculateMirrorPositionFromReference(ref_volt)
+
+        return self.runStage(cache, "positions", key, calculate), key
+
+    def getConfiguration(self):
+        # settings of the processor, used to configure its copies in worker processes
+        return {"precision": self.precision,
+                "K": self.K,
+                "paddingPolicy": self.paddingPolicy,
+                "paddingTargetPointsCount": self.paddingTargetPointsCount,
+                "paddingInterpolationDensity": self.paddingInterpolationDensity,
+                "paddingMinimalFactor": self.paddingMinimalFactor,
+                "paddingMemoryLimit": self.paddingMemoryLimit,
+                "samplingFrequency": self.samplingFrequency,
+                "scanSpeed": self.scanSpeed,
+                "decimationSamplesPerPeriod": self.decimationSamplesPerPeriod,
+                "detector_sensitivity": self.detector_sensitivity,
+                "ref_laser_wavelength": self.ref_laser_wavelength,
+                "spectrum_config_x_min": self.spectrum_config_x_min,
+                "spectrum_config_x_max": self.spectrum_config_x_max,
+                "spectrum_config_pts": self.spectrum_config_pts,
+                "phaseExtractionMethod": self.phaseExtractionMethod,
+                "fringeEstimationLength": self.fringeEstimationLength,
+                "iqMinimalDecimation": self.iqMinimalDecimation,
+                "iqMaximalPhaseStep": self.iqMaximalPhaseStep,
+                "processingAlgorithm": self.processingAlgorithm,
+                "nufftKernelWidth": self.nufftKernelWidth,
+                "nufftChunkLength": self.nufftChunkLength,
+                "zoomRangeMin": self.zoomRangeMin,
+                "zoomRangeMax": self.zoomRangeMax,
+                "zoomPointsCount": self.zoomPointsCount,
+                "zoomQuantizationSteps": self.zoomQuantizationSteps,
+                "spectrumUnit": self.spectrumUnit}
+
+    def setConfiguration(self, configuration):
+        for name, value in configuration.items():
+            if name == "precision":
+                self.setPrecision(value)
+            else:
+                setattr(self, name, value)
+
+    def getBandRange(self):
+        # band [um] of the zoom spectrum and of the adaptive zero-padding, defaults to the range of the common X axis
+        rangeMin = self.zoomRangeMin if self.zoomRangeMin is not None else self.spectrum_config_x_min
+        rangeMax = self.zoomRangeMax if self.zoomRangeMax is not None else self.spectrum_config_x_max
+        return float(rangeMin), float(rangeMax)
+
+    def getPaddingFactor(self, scanLength, mirrorTravel=None):
+        # zero-padding factor used for a scan of the given length and mirror travel [um]
+        if self.paddingPolicy != "adaptive" or mirrorTravel is None:
+            return self.K
+
+        # bin k of the padded spectrum lies at the wavelength 2 * D * K / k, so the band xMin - xMax spans
+        # 2 * D * K * (1 / xMin - 1 / xMax) bins and the bin width at the wavelength x is x^2 / (2 * D * K)
+        rangeMin, rangeMax = self.getBandRange()
+
+        if self.paddingInterpolationDensity is not None:
+            commonAxisStep = ((self.spectrum_config_x_max - self.spectrum_config_x_min) /
+                              (self.spectrum_config_pts - 1))
+            K = self.paddingInterpolationDensity * rangeMax ** 2 / (2.0 * mirrorTravel * commonAxisStep)
+        else:
+            K = self.paddingTargetPointsCount / (2.0 * mirrorTravel * (1.0 / rangeMin - 1.0 / rangeMax))
+
+        # the first scanLength bins reach down to the wavelength 2 * D * K / scanLength, a larger factor would cut
+        # off the short-wavelength end of the band; the padded signal and its real transform take about two real
+        # values per padded sample. Integer factors keep scans of similar length on the same spectral grid
+        bandLimitK = rangeMin * (scanLength - 3) / (2.0 * mirrorTravel)
+        memoryLimitK = self.paddingMemoryLimit / (2 * np.dtype(self.realType).itemsize * scanLength)
+        K = min(int(np.ceil(K)), int(bandLimitK), int(memoryLimitK))
+
+        return max(K, self.paddingMinimalFactor, 2)
+
+    def getPaddedLength(self, scanLength, mirrorTravel=None):
+        return self.fftPlanner.paddedLength(scanLength, self.getPaddingFactor(scanLength, mirrorTravel))
+
+    def getSpectrumX(self, scanLength):
+        # X axis of the spectra returned by the selected algorithm for scans of the given length
+        if self.processingAlgorithm == "zoom":
+            rangeMin, rangeMax = self.getBandRange()
+            return getZoomSpectralAxis(rangeMin, rangeMax, self.zoomPointsCount)[1]
+        else:
+            return self.getSpectralGrid(scanLength).commonX
+
+    def getSpectrumLength(self):
+        # number of points of the spectrum returned by the selected algorithm
+        if self.processingAlgorithm == "zoom":
+            return self.zoomPointsCount
+        else:
+            return self.spectrum_config_pts
+
+    def setPrecision(self, precision):
+        if precision not in processingPrecisions:
+            raise ValueError(f"Unknown processing precision: {precision}")
+
+        self.precision = precision
+        self.realType, self.complexType = processingPrecisions[precision]
+
+    def analyzeData(self, rawReferenceSignal, rawInterferogram, apodizationWindowType="boxcar", out=None, cache=None):
+        # fringe counting algorithm - the mirror position is known at every extremum and every zero crossing
+        # of the reference signal (a quarter of the fringe period apart) and interpolated between them
+        print("Analyzing data (fringe counting algorithm)")
+
+        meas_volt = rawInterferogram - np.mean(rawInterferogram)
+
+        # mirror position for every sample
+        positions, positionsKey = self.getMirrorPosition(rawReferenceSignal, "fringes", cache)
+        print("Total REF mirror travel = ", np.max(positions), "\u03BCm")
+
+        return self.analyzeResampledInterferogram(positions, meas_volt, apodizationWindowType, out, cache,
+                                                  positionsKey)
+
+    def calculateMirrorPositionFromFringes(self, ref_volt):
+        # normalize reference interferometer signal
+        ref_norm = (ref_volt - np.min(ref_volt)) / (np.max(ref_volt) - np.min(ref_volt))
+
+        # find peaks
+        ref_pos_peaks, _ = find_peaks(ref_norm, prominence=0.075)
+        ref_pos_peaks_neg, _ = find_peaks(-ref_norm, prominence=0.075)
+
+        peaks = np.concatenate((ref_pos_peaks, ref_pos_peaks_neg))
+        peaks.sort(kind='mergesort')
+        peaks = peaks[(peaks > 0) & (peaks < len(ref_volt) - 1)]
+
+        # sub-sample position of every peak from a parabola fitted to the peak and its neighbours
+        left = ref_volt[peaks - 1]
+        centre = ref_volt[peaks]
+        right = ref_volt[peaks + 1]
+        curvature = left - 2 * centre + right
+        safeCurvature = np.where(curvature != 0, curvature, 1.0)
+        peaksPosition = peaks + np.where(curvature != 0, 0.5 * (left - right) / safeCurvature, 0.0)
+
+        # sub-sample position of the first zero crossing between every pair of consecutive peaks
+        crossings = np.flatnonzero(np.signbit(ref_volt[:-1]) != np.signbit(ref_volt[1:]))
+        crossingsPosition = crossings + ref_volt[crossings] / (ref_volt[crossings] - ref_volt[crossings + 1])
+
+        firstCrossing = np.searchsorted(crossings, peaks[:-1])
+        firstCrossing = np.minimum(firstCrossing, max(len(crossings) - 1, 0))
+        validCrossing = np.zeros(len(peaks) - 1, dtype=bool)
+        if len(crossings) > 0:
+            validCrossing = crossings[firstCrossing] < peaks[1:]
+
+        # mirror travel between an extremum and a zero crossing is a quarter of the fringe, i.e. lambda / 8
+        um_per_event = self.ref_laser_wavelength / 8
+        peaksTravel = 2 * um_per_event * np.arange(len(peaks))
+        crossingsTravel = peaksTravel[:-1][validCrossing] + um_per_event
+
+        eventsPosition = np.concatenate((peaksPosition, crossingsPosition[firstCrossing[validCrossing]]))
+        eventsTravel = np.concatenate((peaksTravel, crossingsTravel))
+        order = np.argsort(eventsPosition, kind='mergesort')
+
+        # interpolate the position of the mirror for every sample
+        return np.interp(np.arange(len(ref_volt)), eventsPosition[order], eventsTravel[order])
+
     def find_nearest(self, array, value):
         array = np.asarray(array)
         idx = (np.abs(array - value)).argmin()
         return idx
 
-    def analyzeDataHilbertInterpolation(self, rawReferenceSignal, rawInterferogram, apodizationWindowType):
+    def analyzeDataHilbertInterpolation(self, rawReferenceSignal, rawInterferogram, apodizationWindowType, out=None,
+                                        cache=None):
         print("Analyzing data (Hilbert transform-based interpolation algorithm)")
 
-        ref_volt = rawReferenceSignal - np.mean(rawReferenceSignal)
         meas_volt = rawInterferogram - np.mean(rawInterferogram)
 
         # calculate X axis for the acquired interferogram using the Hiblert transform
-        interferogram_X_from_Hilbert = hilbert(ref_volt)
-        interferogram_X_from_Hilbert = np.unwrap(np.angle(interferogram_X_from_Hilbert))
+        interferogram_X_from_Hilbert, positionsKey = self.getMirrorPosition(rawReferenceSignal,
+                                                                            self.phaseExtractionMethod, cache)
 
-        # convert X from instantaneous phase to [um]
-        interferogram_X_from_Hilbert = interferogram_X_from_Hilbert / (2 * np.pi) * (self.ref_laser_wavelength / 2)
+        return self.analyzeResampledInterferogram(interferogram_X_from_Hilbert, meas_volt, apodizationWindowType, out,
+                                                  cache, positionsKey)
 
-        # create an array for Y axis of the resampled interferogram signal
-        resampled_interferogram_Y = np.zeros(len(meas_volt))
-        # create an array for X axis of the resampled interferogram signal, where all X values are evenly spaced
-        resampled_interferogram_X = np.linspace(start=np.min(interferogram_X_from_Hilbert),
-                                                stop=np.max(interferogram_X_from_Hilbert),
-                                                num=len(resampled_interferogram_Y),
-                                                endpoint=True)
-
-        # resample Y axis with accordance with the new X axis retrieved with the use of the Hilbert transform
-        resampled_interferogram_Y = np.interp(resampled_interferogram_X, interferogram_X_from_Hilbert, meas_volt)
-
-        # copy the interferogram before apodization
-        rawInterferogramY = np.copy(resampled_interferogram_Y)
+    def analyzeResampledInterferogram(self, positions, meas_volt, apodizationWindowType, out=None, cache=None,
+                                      positionsKey=None):
+        # resample Y axis with accordance with the new, evenly spaced X axis retrieved from the reference signal
+        resampledKey = (positionsKey, self.precision)
+        resampled_interferogram_X, rawInterferogramY = \
+            self.runStage(cache, "resampled", resampledKey, lambda: self.resampleInterferogram(positions, meas_volt))
 
         # apodize the interferogram
         print(f"Applied apodization window: {apodizationWindowType}")
-        window = self.createAssymetricApodizationWindow(resampled_interferogram_Y, apodizationWindowType)
-        resampled_interferogram_Y = resampled_interferogram_Y * window
+        apodizedKey = (resampledKey, apodizationWindowType)
+        window, resampled_interferogram_Y = \
+            self.runStage(cache, "apodized", apodizedKey,
+                          lambda: self.apodizeInterferogram(rawInterferogramY, apodizationWindowType))
+
+        # copy the interferogram before apodization
+        rawInterferogramY = np.copy(rawInterferogramY)
 
         # calculate total distance traveled by the mirror
-        mirror_travel_distance_total = np.max(interferogram_X_from_Hilbert)
+        mirror_travel_distance_total = np.max(positions)
 
-        # zero-padding
-        np_pad_zeros = np.zeros(int(((self.K - 1) * len(resampled_interferogram_Y))))
-        meas_volt_padded = np.concatenate((resampled_interferogram_Y, np_pad_zeros))
+        # calculate spectrum in dBm, spectra kept in the cache can not use the shared workspace buffer
+        paddedLength = self.getPaddedLength(len(resampled_interferogram_Y), mirror_travel_distance_total)
+        spectrumKey = (apodizedKey, paddedLength, self.spectrumUnit, self.detector_sensitivity)
+        magnitudeBuffer = None
+        if cache is None:
+            magnitudeBuffer = self.workspace.get("magnitude", resampled_interferogram_Y.shape, self.realType)
 
-        # calculate spectrum
-        spectrum_x = np.arange(0, len(resampled_interferogram_Y), 1)
-        spectrum = np.fft.rfft(meas_volt_padded)
+        spectrum_abs = self.runStage(cache, "spectrum", spectrumKey,
+                                     lambda: self.calculateSpectrum(resampled_interferogram_Y, out=magnitudeBuffer,
+                                                                    mirrorTravel=mirror_travel_distance_total))
 
-        # cut spectrum to match the correct X axis (required due to padding)
-        spectrum = spectrum[0:len(spectrum_x)]
-        # calculate absolute value from the spectrum
-        spectrum_abs = np.abs(spectrum)
+        # interpolate the spectrum on a X axis common to all spectra, the axis and the interpolation plan are
+        # cached and shared between scans with the same configuration
+        grid = self.getSpectralGrid(len(resampled_interferogram_Y), mirror_travel_distance_total)
 
-        # normalize
-        spectrum_abs = spectrum_abs / (len(spectrum_abs) / 2)
-        # convert Y axis from volts to watts
-        spectrum_abs = spectrum_abs / self.detector_sensitivity
-        # conver Y axis from watts to dBm
-        spectrum_abs = 10.0 * np.log10(1.0E3 * spectrum_abs)
+        start_index, stop_index = grid.cropBins(mirror_travel_distance_total)
+        print(f"Start bin: {start_index}, Stop bin: {stop_index}")
 
-        # convert k to wavelength in um
-        spectrum_x_recalc = np.zeros(len(spectrum_abs))
+        common_spectrum_X = grid.commonX
+        with self.stageTimer.measure("commonAxis", grid.pointsCount):
+            spectrum_abs = grid.interpolate(spectrum_abs, mirror_travel_distance_total, out=out,
+                                            workspace=self.workspace)
 
-        for i in range(1, len(spectrum_abs)):
-            spectrum_x_recalc[i] = (2 * mirror_travel_distance_total / spectrum_x[i]) * self.K
+        output = {"spectrumX": common_spectrum_X,                   # spectrum X axis
+                  "spectrumY": spectrum_abs,                        # spectrum Y axis
+                  "interferogramX": resampled_interferogram_X,      # interferogram X axis in um
+                  "interferogramY": resampled_interferogram_Y,      # interferogram Y axis (after apodization)
+                  "apodizationWindow": window,                      # applied apodization window
+                  "rawInterferogramY": rawInterferogramY}           # interferogram Y axis (before apodization)
 
-        # cut the important part
-        spectrum_slicing_index_start = 1
-        spectrum_slicing_index_stop = len(spectrum_abs) - 2
+        return output
 
-        spectrum_abs = spectrum_abs[spectrum_slicing_index_start: spectrum_slicing_index_stop]
-        spectrum_x_recalc = spectrum_x_recalc[spectrum_slicing_index_start: spectrum_slicing_index_stop]
+    def analyzeDataNUFFT(self, rawReferenceSignal, rawInterferogram, apodizationWindowType, out=None, cache=None):
+        # spectrum evaluated directly from the non-uniformly sampled interferogram (type-1 NUFFT), no resampling
+        print("Analyzing data (non-uniform FFT algorithm)")
 
-        # make a new X axis, common to all spectra and interpolate them on it
-        spectrum_config_x_min = 0.1
-        spectrum_config_x_max = 300.0
-        spectrum_config_pts = int(2E6)
-        common_spectrum_X = np.linspace(start=spectrum_config_x_min,
-                                        stop=spectrum_config_x_max,
-                                        num=spectrum_config_pts,
-                                        endpoint=True)
+        meas_volt = (rawInterferogram - np.mean(rawInterferogram)).astype(self.realType)
 
-        common_spectrum_X = np.flip(common_spectrum_X)
+        # mirror position for every sample
+        positions, _ = self.getMirrorPosition(rawReferenceSignal, self.phaseExtractionMethod, cache)
+        mirror_travel_distance_total = np.max(positions)
+        scanLength = len(meas_volt)
 
-        start_index = self.find_nearest(spectrum_x_recalc, spectrum_config_x_min)
-        stop_index = self.find_nearest(spectrum_x_recalc, spectrum_config_x_max)
+        # apodize the interferogram, the window is defined over the sample index
+        print(f"Applied apodization window: {apodizationWindowType}")
+        window, apodizedInterferogram = self.apodizeInterferogram(meas_volt, apodizationWindowType)
 
-        print(f"Start index: {start_index}, Stop index: {stop_index}")
-        print(f"X Start: {spectrum_x_recalc[start_index]}, Stop: {spectrum_x_recalc[stop_index]}")
-        print(f"Y Start: {spectrum_abs[start_index]}, Stop: {spectrum_abs[stop_index]}")
+        # only the bins covering the configured spectral range are needed
+        grid = self.getSpectralGrid(scanLength, mirror_travel_distance_total)
+        start_index, stop_index = grid.cropBins(mirror_travel_distance_total)
+        print(f"Start bin: {start_index}, Stop bin: {stop_index}")
 
-        axisXCut = spectrum_x_recalc[stop_index:start_index]
-        axisYCut = spectrum_abs[stop_index:start_index]
+        spectrum = self.calculateSpectrumNUFFT(positions, apodizedInterferogram, mirror_travel_distance_total,
+                                               start_index, stop_index)
+        with self.stageTimer.measure("commonAxis", grid.pointsCount):
+            spectrum_abs = grid.interpolate(spectrum, mirror_travel_distance_total, out=out, workspace=self.workspace)
 
-        axisXCut = np.flip(axisXCut)
-        axisYCut = np.flip(axisYCut)
+        output = {"spectrumX": grid.commonX,                        # spectrum X axis
+                  "spectrumY": spectrum_abs,                        # spectrum Y axis
+                  "interferogramX": positions.astype(self.realType),    # interferogram X axis in um (non-uniform)
+                  "interferogramY": apodizedInterferogram,          # interferogram Y axis (after apodization)
+                  "apodizationWindow": window,                      # applied apodization window
+                  "rawInterferogramY": meas_volt}                   # interferogram Y axis (before apodization)
 
-        spectrum_abs = np.interp(common_spectrum_X, axisXCut, axisYCut)
+        return output
 
-        output = {"spectrumX": common_spectrum_X,                   # spectrum X axis
+    def analyzeDataZoomFFT(self, rawReferenceSignal, rawInterferogram, apodizationWindowType, out=None, cache=None):
+        # spectrum evaluated with the chirp-z transform on a dense grid restricted to the requested band,
+        # without zero-padding and without interpolation on the common X axis
+        print("Analyzing data (zoom FFT algorithm)")
+
+        meas_volt = rawInterferogram - np.mean(rawInterferogram)
+
+        positions, positionsKey = self.getMirrorPosition(rawReferenceSignal, self.phaseExtractionMethod, cache)
+
+        # the mean sample spacing rounded down, so that the spectral band stays sampled at least as densely
+        meanSpacing = (np.max(positions) - np.min(positions)) / (len(meas_volt) - 1)
+        sampleSpacing = 2.0 ** (np.floor(np.log2(meanSpacing) * self.zoomQuantizationSteps) /
+                                self.zoomQuantizationSteps)
+
+        resampled_interferogram_X, rawInterferogramY = \
+            self.runStage(cache, "resampled", (positionsKey, self.precision, sampleSpacing),
+                          lambda: self.resampleInterferogram(positions, meas_volt, sampleSpacing))
+
+        # apodize the interferogram
+        print(f"Applied apodization window: {apodizationWindowType}")
+        window, resampled_interferogram_Y = self.apodizeInterferogram(rawInterferogramY, apodizationWindowType)
+
+        # copy the interferogram before apodization
+        rawInterferogramY = np.copy(rawInterferogramY)
+
+        spectrumX, spectrum_abs = self.calculateSpectrumZoom(resampled_interferogram_Y, sampleSpacing, out)
+
+        output = {"spectrumX": spectrumX,                           # spectrum X axis (band only)
                   "spectrumY": spectrum_abs,                        # spectrum Y axis
                   "interferogramX": resampled_interferogram_X,      # interferogram X axis in um
                   "interferogramY": resampled_interferogram_Y,      # interferogram Y axis (after apodization)
@@ -220,84 +897,608 @@ class DataProcessor:
 
         return output
 
-    def createAssymetricApodizationWindow(self, interferogram, windowType):
+    def calculateSpectrumZoom(self, interferogram, sampleSpacing, out=None):
+        rangeMin, rangeMax = self.getBandRange()
+
+        # the spectral axis depends only on the band, so it is shared by all scans
+        _, wavelengths = getZoomSpectralAxis(rangeMin, rangeMax, self.zoomPointsCount)
+
+        # trailing zeros do not change the transform, the interferogram is padded to a rounded length
+        steps = self.zoomQuantizationSteps
+        transformLength = int(np.ceil(2.0 ** (np.ceil(np.log2(len(interferogram)) * steps) / steps)))
+        transform = getZoomTransform(transformLength, rangeMin, rangeMax, self.zoomPointsCount, sampleSpacing)
+
+        paddedInterferogram = self.workspace.get("zoomPadded", (transformLength,), interferogram.dtype)
+        paddedInterferogram[:len(interferogram)] = interferogram
+        paddedInterferogram[len(interferogram):] = 0.0
+
+        with self.stageTimer.measure("czt", self.zoomPointsCount):
+            spectrum = transform(paddedInterferogram)
+
+        if out is None:
+            out = np.empty(self.zoomPointsCount, dtype=self.realType)
+
+        # absolute value, normalized and converted from volts to watts, then to the requested unit
+        spectrum_abs = self.scaleSpectrumMagnitude(spectrum, len(interferogram), out)
+
+        return wavelengths, spectrum_abs
+
+    def calculateSpectrumNUFFT(self, positions, interferogram, mirrorTravel, startBin, stopBin):
+        # bin k corresponds to the spatial frequency k / (D * K) [1/um], the same as in the padded FFT of the
+        # resampled interferogram, so the result can be interpolated with the common spectral grid
+        scanLength = len(interferogram)
+        gridLength = self.getPaddedLength(scanLength, mirrorTravel)
+        oversampling = gridLength / scanLength
+
+        if oversampling < 2:
+            raise ValueError("NUFFT requires a zero-padding factor of at least 2")
+
+        with self.stageTimer.measure("gridding", scanLength):
+            # density compensation - every sample represents the mirror travel around it, normalized to the mean step
+            meanStep = (np.max(positions) - np.min(positions)) / (scanLength - 1)
+            weights = interferogram * (np.gradient(positions) / meanStep)
+
+            # spread the samples onto the grid with the Kaiser-Bessel kernel
+            width = self.nufftKernelWidth
+            beta = np.pi * np.sqrt((width / oversampling) ** 2 * (oversampling - 0.5) ** 2 - 0.8)
+
+            # every sample contributes to the nearest 'width' grid nodes, kernel values are linearly interpolated
+            # from a precomputed table
+            resolution = 1024
+            kernelTable = kaiserBesselKernelTable(width, beta, resolution)
+            uniformGrid = np.zeros(gridLength)
+
+            # the samples are gridded in chunks, the (width, chunk) temporary arrays stay small for any scan length
+            for chunkStart in range(0, scanLength, self.nufftChunkLength):
+                chunk = slice(chunkStart, chunkStart + self.nufftChunkLength)
+
+                # positions of the samples on the oversampled uniform grid
+                gridPositions = positions[chunk] * (scanLength / mirrorTravel)
+
+                firstNode = np.floor(gridPositions).astype(np.intp) - (width // 2 - 1)
+                nodes = firstNode + np.arange(width).reshape(-1, 1)
+
+                tablePosition = (nodes - gridPositions + width / 2) * resolution
+                tableIdx = tablePosition.astype(np.intp)
+                tableFraction = np.subtract(tablePosition, tableIdx, out=tablePosition)
+                kernelValues = kernelTable[tableIdx] * (1.0 - tableFraction)
+                kernelValues += kernelTable[tableIdx + 1] * tableFraction
+                kernelValues *= weights[chunk]
+
+                # accumulate over the range of nodes covered by the chunk, nodes beyond the grid wrap around
+                lowestNode = int(nodes.min())
+                chunkGrid = np.bincount((nodes - lowestNode).reshape(-1), weights=kernelValues.reshape(-1))
+
+                if lowestNode >= 0 and lowestNode + len(chunkGrid) <= gridLength:
+                    uniformGrid[lowestNode:lowestNode + len(chunkGrid)] += chunkGrid
+                else:
+                    np.add.at(uniformGrid, np.arange(lowestNode, lowestNode + len(chunkGrid)) % gridLength, chunkGrid)
+
+        with self.stageTimer.measure("fft", gridLength):
+            spectrum = self.fftPlanner.rfft(uniformGrid.astype(self.realType, copy=False))
+
+        # deconvolve the kernel and convert only the bins within the configured spectral range
+        with self.stageTimer.measure("magnitude", stopBin + 1 - startBin):
+            bins = np.arange(startBin, stopBin + 1)
+            spectrum_abs = np.empty(stopBin + 1, dtype=self.realType)
+            spectrum_abs[startBin:] = np.abs(spectrum[bins]) / kaiserBesselKernelTransform(bins / gridLength, width,
+                                                                                           beta)
+
+            # normalize, convert Y axis from volts to watts and then to the requested unit
+            validBins = spectrum_abs[startBin:]
+            validBins *= 1.0 / ((scanLength / 2) * self.detector_sensitivity)
+            self.convertSpectrumUnit(validBins, out=validBins)
 
-        # find the ZPD index
-        zpdIdx = self.find_nearest(interferogram, np.max(interferogram))
+        return spectrum_abs
 
-        if windowType == "triangular":
-            winLeft = signal.windows.triang((zpdIdx + 1) * 2)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.triang(((len(interferogram) - 1) - zpdIdx) * 2)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+    def analyzeBatch(self, reference2D, interferogram2D, window):
+        # process N stacked scans (one scan per row) with the Hilbert transform-based interpolation algorithm,
+        # the scans are processed in chunks of rows to keep the temporary arrays within a reasonable size
+        print("Analyzing data batch (Hilbert transform-based interpolation algorithm)")
 
-            return window
+        reference2D = np.atleast_2d(reference2D)
+        interferogram2D = np.atleast_2d(interferogram2D)
 
-        elif windowType == "blackman-harris":
-            winLeft = signal.windows.blackmanharris((zpdIdx + 1) * 2)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.blackmanharris(((len(interferogram) - 1) - zpdIdx) * 2)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+        if reference2D.shape != interferogram2D.shape:
+            raise ValueError("Reference and interferogram batches have different shapes!")
 
-            return window
+        if interferogram2D.shape[0] == 0 or interferogram2D.shape[-1] == 0:
+            raise ValueError("Batch contains no scans!")
 
-        elif windowType == "gauss":
-            winLeft = signal.windows.gaussian((zpdIdx + 1) * 2, std=7)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.gaussian(((len(interferogram) - 1) - zpdIdx) * 2, std=7)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+        self.stageTimer.startCall()
 
-            return window
+        reference2D, interferogram2D = self.decimateScan(reference2D, interferogram2D)
+        scansCount, scanLength = interferogram2D.shape
 
-        elif windowType == "hanning":
-            winLeft = signal.windows.hann((zpdIdx + 1) * 2)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.hann(((len(interferogram) - 1) - zpdIdx) * 2)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+        spectraY = np.empty((scansCount, self.spectrum_config_pts), dtype=self.realType)
+        interferogramsX = np.empty((scansCount, scanLength), dtype=self.realType)
+        interferogramsY = np.empty((scansCount, scanLength), dtype=self.realType)
+        rawInterferogramsY = np.empty((scansCount, scanLength), dtype=self.realType)
+        apodizationWindows = np.empty((scansCount, scanLength), dtype=self.realType)
 
-            return window
+        print(f"Applied apodization window: {window}")
 
-        elif windowType == "boxcar":
-            window = signal.windows.boxcar(len(interferogram))
+        with self.stageTimer.measure("total", interferogram2D.size):
+            for chunkStart in range(0, scansCount, self.batchChunkSize):
+                rows = slice(chunkStart, min(chunkStart + self.batchChunkSize, scansCount))
+
+                ref_volt = reference2D[rows] - np.mean(reference2D[rows], axis=-1, keepdims=True)
+                meas_volt = interferogram2D[rows] - np.mean(interferogram2D[rows], axis=-1, keepdims=True)
+
+                # mirror position for every sample of every scan
+                positions = self.calculateMirrorPositionFromReference(ref_volt)
 
-            return window
+                # resample all interferograms on their evenly spaced X axes
+                interferogramsX[rows], rawInterferogramsY[rows] = self.resampleInterferogram(positions, meas_volt)
 
-        elif windowType == "tukey_0.1":
-            winLeft = signal.windows.tukey((zpdIdx + 1) * 2, 0.1)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.tukey(((len(interferogram) - 1) - zpdIdx) * 2, 0.1)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+                # asymmetric windows depend on the ZPD position of every scan
+                with self.stageTimer.measure("apodization", interferogramsY[rows].size):
+                    for r in range(rows.start, rows.stop):
+                        apodizationWindows[r] = self.createAssymetricApodizationWindow(rawInterferogramsY[r], window)
 
-            return window
+                    np.multiply(rawInterferogramsY[rows], apodizationWindows[rows], out=interferogramsY[rows])
 
-        elif windowType == "tukey_0.2":
-            winLeft = signal.windows.tukey((zpdIdx + 1) * 2, 0.2)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.tukey(((len(interferogram) - 1) - zpdIdx) * 2, 0.2)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+                # spectra of the whole chunk in dBm, the chunk shares a single padding factor and spectral grid
+                mirrorTravel = np.max(positions, axis=-1)
+                grid = self.getSpectralGrid(scanLength, float(np.max(mirrorTravel)))
 
-            return window
+                spectra = self.calculateSpectrum(interferogramsY[rows],
+                                                 out=self.workspace.get("batchMagnitude", interferogramsY[rows].shape,
+                                                                        self.realType),
+                                                 mirrorTravel=float(np.max(mirrorTravel)))
 
-        elif windowType == "tukey_0.5":
-            winLeft = signal.windows.tukey((zpdIdx + 1) * 2, 0.5)
-            winLeft = winLeft[:int(len(winLeft) / 2)]
-            winRight = signal.windows.tukey(((len(interferogram) - 1) - zpdIdx) * 2, 0.5)
-            winRight = winRight[int(len(winRight) / 2):]
-            window = np.concatenate((winLeft, winRight))
+                with self.stageTimer.measure("commonAxis", spectraY[rows].size):
+                    for r in range(rows.start, rows.stop):
+                        grid.interpolate(spectra[r - rows.start], mirrorTravel[r - rows.start], out=spectraY[r],
+                                         workspace=self.workspace)
 
-            return window
+        output = {"spectrumX": grid.commonX,                        # spectrum X axis common to all scans
+                  "spectraY": spectraY,                             # spectra Y axes, one per row
+                  "averageSpectrumY": np.mean(spectraY, axis=0),    # average spectrum Y axis
+                  "interferogramsX": interferogramsX,               # interferograms X axes in um
+                  "interferogramsY": interferogramsY,               # interferograms Y axes (after apodization)
+                  "apodizationWindows": apodizationWindows,         # applied apodization windows
+                  "rawInterferogramsY": rawInterferogramsY,         # interferograms Y axes (before apodization)
+                  "timings": self.stageTimer.finishCall()}          # wall time of the processing stages
 
-        # elif type == "nb_weak":
-        #     # norton-beer weak
-        #     signal.windows.
+        return output
+
+    def calculateMirrorPositionFromReference(self, ref_volt):
+        # instantaneous phase of the reference signal along the last axis
+        if self.phaseExtractionMethod == "iq":
+            with self.stageTimer.measure("iqDemodulation", ref_volt.size):
+                if ref_volt.ndim == 1:
+                    phase = self.calculatePhaseIQ(ref_volt)
+                else:
+                    phase = np.empty(ref_volt.shape)
+                    for r in range(ref_volt.shape[0]):
+                        phase[r] = self.calculatePhaseIQ(ref_volt[r])
+        else:
+            phase = self.calculatePhaseHilbert(ref_volt)
+
+        # convert X from instantaneous phase to [um]
+        return phase / (2 * np.pi) * (self.ref_laser_wavelength / 2)
+
+    def calculatePhaseHilbert(self, ref_volt):
+        with self.stageTimer.measure("hilbert", ref_volt.size):
+            wrappedPhase = np.angle(self.fftPlanner.analyticSignal(ref_volt))
+
+        with self.stageTimer.measure("unwrap", ref_volt.size):
+            return np.unwrap(wrappedPhase, axis=-1)
+
+    def estimateFringeFrequency(self, ref_volt):
+        # fringe frequency [cycles / sample] from the periodogram peak of a segment taken from the middle of the scan
+        segmentLength = min(len(ref_volt), self.fringeEstimationLength)
+        segmentStart = (len(ref_volt) - segmentLength) // 2
+        segment = ref_volt[segmentStart:segmentStart + segmentLength]
+
+        power = np.abs(self.fftPlanner.rfft(segment)) ** 2
+        peak = int(np.argmax(power[1:])) + 1
+
+        # refine the position of the peak with a parabolic interpolation of the log-power
+        offset = 0.0
+        if peak < len(power) - 1:
+            a, b, c = np.log(power[peak - 1:peak + 2] + np.finfo(float).tiny)
+            if a - 2 * b + c != 0:
+                offset = 0.5 * (a - c) / (a - 2 * b + c)
+
+        return (peak + offset) / segmentLength
+
+    def calculatePhaseIQ(self, ref_volt):
+        samplesCount = len(ref_volt)
+        fringeFrequency = self.estimateFringeFrequency(ref_volt)
+
+        # decimate down to roughly one sample per fringe
+        decimation = int(1.0 / fringeFrequency) if fringeFrequency > 0 else 0
+
+        if decimation < self.iqMinimalDecimation or samplesCount < 4 * decimation:
+            print("IQ demodulation not applicable (reference signal not oversampled), using the Hilbert transform")
+            return self.calculatePhaseHilbert(ref_volt)
+
+        # mix to baseband, the local oscillator is built as an outer product of two short phasor tables
+        blockLength = int(np.ceil(np.sqrt(samplesCount)))
+        blocksCount = int(np.ceil(samplesCount / blockLength))
+        fineOscillator = np.exp(-2j * np.pi * fringeFrequency * np.arange(blockLength))
+        coarseOscillator = np.exp(-2j * np.pi * fringeFrequency * blockLength * np.arange(blocksCount))
+        localOscillator = np.multiply.outer(coarseOscillator, fineOscillator).reshape(-1)[:samplesCount]
+
+        baseband = ref_volt * localOscillator
+
+        # low-pass filter and decimate with a triangular (1, 2, ..., D, D, ..., 2, 1) kernel spanning two blocks of
+        # D samples; it has spectral zeros at multiples of the fringe frequency, so the mixing image is suppressed
+        blocksCount = samplesCount // decimation
+        blocks = baseband[:blocksCount * decimation].reshape(blocksCount, decimation)
+        blockSums = blocks.sum(axis=1)
+        blockMoments = blocks @ np.arange(decimation, dtype=float)
+
+        decimated = (blockMoments[:-1] + blockSums[:-1]) + (decimation * blockSums[1:] - blockMoments[1:])
+        decimatedIdx = np.arange(1, blocksCount) * decimation - 0.5
+
+        # the fringe frequency is estimated in the middle of the scan only, while the mirror accelerates or its
+        # velocity jitters the residual phase may change too fast to be unwrapped at one sample per fringe
+        phaseSteps = np.angle(decimated[1:] * np.conj(decimated[:-1]))
+
+        if len(phaseSteps) == 0 or np.max(np.abs(phaseSteps)) > self.iqMaximalPhaseStep:
+            print("IQ demodulation not applicable (fringe frequency not constant), using the Hilbert transform")
+            return self.calculatePhaseHilbert(ref_volt)
+
+        # unwrap the slowly varying residual phase at the low rate and interpolate it back to every sample
+        residualPhase = np.unwrap(np.angle(decimated))
+        samplesIdx = np.arange(samplesCount)
+        residualPhase = np.interp(samplesIdx, decimatedIdx, residualPhase)
+
+        return residualPhase + 2 * np.pi * fringeFrequency * samplesIdx
+
+    def resampleInterferogram(self, positions, meas_volt, sampleSpacing=None):
+        with self.stageTimer.measure("resampling", meas_volt.size):
+            # create an X axis for the resampled interferogram signal, where all X values are evenly spaced, by
+            # default with as many samples as acquired, otherwise every sampleSpacing [um] (a single scan only)
+            if sampleSpacing is None:
+                resampledX = np.linspace(start=np.min(positions, axis=-1),
+                                         stop=np.max(positions, axis=-1),
+                                         num=meas_volt.shape[-1],
+                                         endpoint=True,
+                                         axis=-1)
+            else:
+                samplesCount = int((np.max(positions) - np.min(positions)) / sampleSpacing) + 1
+                resampledX = np.min(positions) + sampleSpacing * np.arange(samplesCount)
+
+            if meas_volt.ndim == 1:
+                resampledY = np.interp(resampledX, positions, meas_volt)
+            else:
+                resampledY = interpolateRows(resampledX, positions, meas_volt)
+
+        # the rest of the processing chain runs with the selected precision
+        return resampledX.astype(self.realType, copy=False), resampledY.astype(self.realType, copy=False)
+
+    def getSpectralGrid(self, scanLength, mirrorTravel=None):
+        # the actual padding factor follows from the fast length of the padded transform
+        paddingFactor = self.getPaddedLength(scanLength, mirrorTravel) / scanLength
+
+        return getSpectralGrid(self.spectrum_config_x_min, self.spectrum_config_x_max, self.spectrum_config_pts,
+                               paddingFactor, scanLength)
+
+    def calculateSpectrum(self, interferogram, out=None, mirrorTravel=None):
+        scanLength = interferogram.shape[-1]
+
+        # calculate spectrum, zero-padding to a fast length is done by the transform itself
+        paddedLength = self.getPaddedLength(scanLength, mirrorTravel)
+        with self.stageTimer.measure("fft", interferogram.size // scanLength * paddedLength):
+            spectrum = self.fftPlanner.rfft(interferogram, n=paddedLength)
+
+        if out is None:
+            out = np.empty(interferogram.shape, dtype=self.realType)
+
+        # cut spectrum to match the correct X axis (required due to padding), the rest of the chain runs in place
+        return self.scaleSpectrumMagnitude(spectrum[..., 0:scanLength], scanLength, out)
+
+    def scaleSpectrumMagnitude(self, spectrum, scanLength, out):
+        with self.stageTimer.measure("magnitude", out.size):
+            # calculate absolute value from the spectrum
+            np.abs(spectrum, out=out)
+            # normalize and convert Y axis from volts to watts in a single pass
+            out *= 1.0 / ((scanLength / 2) * self.detector_sensitivity)
+            # conver Y axis from watts to dBm
+            return self.convertSpectrumUnit(out, out=out)
+
+    def convertSpectrumUnit(self, spectrum_abs, out=None):
+        # spectra are calculated in watts, the conversion to dBm is skipped when linear spectra are requested
+        if self.spectrumUnit == "W":
+            if out is None or out is spectrum_abs:
+                return spectrum_abs
+
+            np.copyto(out, spectrum_abs)
+            return out
+
+        return convertWattsToDBm(spectrum_abs, out=out)
+
+    def apodizeInterferogram(self, interferogram, windowType):
+        # returns the window and the apodized copy of the interferogram
+        with self.stageTimer.measure("apodization", len(interferogram)):
+            window = self.createAssymetricApodizationWindow(interferogram, windowType)
+            return window, interferogram * window
+
+    def createAssymetricApodizationWindow(self, interferogram, windowType):
+
+        if windowType not in apodizationWindowsRegistry:
+            return None
+
+        # find the ZPD index (first occurrence of the maximum)
+        zpdIdx = int(np.argmax(interferogram))
+
+        return getApodizationWindow(windowType, len(interferogram), zpdIdx, self.realType)
+
+
+class CoherentInterferogramAverager:
+
+    def __init__(self, dataProcessor):
+        # running mean of interferograms aligned on the ZPD, all scans are resampled on the evenly spaced
+        # optical path grid of the first scan
+        self.DataProcessor = dataProcessor
+        self.correlationHalfLength = 4096   # samples around the ZPD used for the cross-correlation
+
+        self.gridX = None
+        self.gridStep = None
+        self.interferogramSum = None
+        self.samplesCount = None
+        self.scansCount = 0
+        self.settingsKey = None     # settings the mirror positions of the accumulated scans were calculated with
+
+    def reset(self):
+        self.gridX = None
+        self.gridStep = None
+        self.interferogramSum = None
+        self.samplesCount = None
+        self.scansCount = 0
+        self.settingsKey = None
+
+    def getSettingsKey(self):
+        return (self.DataProcessor.getMirrorPositionMethod(), self.DataProcessor.ref_laser_wavelength,
+                self.DataProcessor.precision, self.DataProcessor.getDecimationFactor())
+
+    def addScan(self, rawReferenceSignal, rawInterferogram, backwardScan=False, cache=None):
+        # the mirror position is retrieved with the method of the selected algorithm, with the ScanPipelineCache
+        # of the scan it is shared with the processing of the scan on its own
+        rawReferenceSignal, rawInterferogram = self.DataProcessor.decimateScan(rawReferenceSignal, rawInterferogram,
+                                                                               cache)
+
+        if backwardScan:
+            rawReferenceSignal, rawInterferogram = self.DataProcessor.reverseScan(rawReferenceSignal, rawInterferogram)
+        meas_volt = rawInterferogram - np.mean(rawInterferogram)
+
+        positions, _ = self.DataProcessor.getMirrorPosition(rawReferenceSignal,
+                                                            self.DataProcessor.getMirrorPositionMethod(), cache)
+
+        if self.gridX is None:
+            # the first scan defines the grid
+            self.settingsKey = self.getSettingsKey()
+            self.gridX, alignedY = self.DataProcessor.resampleInterferogram(positions, meas_volt)
+            self.gridStep = (self.gridX[-1] - self.gridX[0]) / (len(self.gridX) - 1)
+            self.interferogramSum = np.zeros(len(self.gridX))
+            self.samplesCount = np.zeros(len(self.gridX), dtype=np.intp)
+            valid = np.ones(len(self.gridX), dtype=bool)
+        else:
+            with self.DataProcessor.stageTimer.measure("alignment", len(meas_volt)):
+                lag = self.findLag(positions, meas_volt)
+
+                # sample the scan at the grid positions shifted by the lag
+                samplingX = positions.min() + (np.arange(len(self.gridX)) - lag) * self.gridStep
+                valid = (samplingX >= positions.min()) & (samplingX <= positions.max())
+                alignedY = np.interp(samplingX, positions, meas_volt).astype(self.DataProcessor.realType, copy=False)
+                alignedY[~valid] = 0
+
+        self.interferogramSum += alignedY
+        self.samplesCount += valid
+        self.scansCount += 1
+
+        return self.gridX, alignedY
+
+    def findLag(self, positions, meas_volt):
+        # shift [samples] of the scan (on its own grid with the common step) against the running mean
+        scanX = np.arange(positions.min(), positions.max(), self.gridStep)
+        scanY = np.interp(scanX, positions, meas_volt)
+        meanX, meanY = self.getAverageInterferogram()
+
+        halfLength = self.correlationHalfLength
+        meanZpd = int(np.argmax(np.abs(meanY)))
+        scanZpd = int(np.argmax(np.abs(scanY)))
+
+        meanSegment = meanY[max(meanZpd - halfLength, 0):meanZpd + halfLength]
+        scanSegment = scanY[max(scanZpd - halfLength, 0):scanZpd + halfLength]
+
+        correlation = signal.correlate(meanSegment, scanSegment, mode="full", method="fft")
+        peak = int(np.argmax(correlation))
+
+        # sub-sample refinement with a parabola fitted to the correlation peak
+        offset = 0.0
+        if 0 < peak < len(correlation) - 1:
+            a, b, c = correlation[peak - 1:peak + 2]
+            if a - 2 * b + c != 0:
+                offset = 0.5 * (a - c) / (a - 2 * b + c)
+
+        segmentLag = peak + offset - (len(scanSegment) - 1)
+        return (max(meanZpd - halfLength, 0) - max(scanZpd - halfLength, 0)) + segmentLag
+
+    def getAverageInterferogram(self):
+        averageY = self.interferogramSum / np.maximum(self.samplesCount, 1)
+        return self.gridX, averageY.astype(self.DataProcessor.realType, copy=False)
+
+    def calculateSpectrum(self, apodizationWindowType):
+        # single transform of the accumulated interferogram, it is evenly sampled already, so the zoom FFT
+        # evaluates it directly and the other algorithms share the padded FFT of the resampled interferogram
+        averageX, averageY = self.getAverageInterferogram()
+
+        self.DataProcessor.stageTimer.startCall()
+
+        with self.DataProcessor.stageTimer.measure("total", len(averageY)):
+            if self.DataProcessor.processingAlgorithm == "zoom":
+                window, apodizedY = self.DataProcessor.apodizeInterferogram(averageY, apodizationWindowType)
+                spectrumX, spectrumY = self.DataProcessor.calculateSpectrumZoom(apodizedY, self.gridStep)
+                output = {"spectrumX": spectrumX,
+                          "spectrumY": spectrumY,
+                          "interferogramX": averageX,
+                          "interferogramY": apodizedY,
+                          "apodizationWindow": window,
+                          "rawInterferogramY": averageY}
+            else:
+                output = self.DataProcessor.analyzeResampledInterferogram(averageX, averageY, apodizationWindowType)
+
+        output["timings"] = self.DataProcessor.stageTimer.finishCall()
+        return output
 
-        #     return interferogram
 
+class SpectralStatisticsAccumulator:
+
+    def __init__(self, statistic="mean"):
+        # per-bin streaming statistics of spectra on a common X axis, spectra themselves are not kept; the statistic
+        # is chosen before the first spectrum and the accumulator has to be reset when it changes:
+        # "mean" - Welford running mean and variance, in the power averaging mode the spectra are in watts and this is
+        #          the linear power mean, converted to dBm only when it is drawn or exported,
+        # "sigma clipping" - the same, values further than clipSigma standard deviations from the running mean are
+        #                    left out of their bin and a spectrum with too many such bins is rejected as a whole;
+        #                    the clipping threshold uses the spread of all valid values, clipped ones included, so that
+        #                    a bin whose first values happen to agree is not locked by its own tiny deviation,
+        # "median" - running median estimated by stochastic approximation, robust to occasional outlier spectra
+        self.statistic = statistic
+        self.spectrumUnit = "dBm"       # "dBm" or "W", the same as the unit of the DataProcessor spectra
+        self.clipSigma = 3.0
+        self.clipMinimalCount = 3       # clipping starts after this number of spectra
+        self.clipToleranceDB = 0.1      # smaller deviations are never clipped, out of band bins barely vary
+        self.rejectFraction = 0.5       # spectra with a larger share of clipped bins are rejected
+        self.reset()
+
+    def reset(self):
+        self.spectrumX = None
+        self.counts = None                  # number of values accumulated in every bin
+        self.mean = None
+        self.squaredDeviationsSum = None    # sum of squared deviations from the mean (M2 of the Welford algorithm)
+        self.median = None
+        self.absoluteDeviationMean = None   # mean absolute deviation from the running median
+        self.unclippedCounts = None         # Welford statistics of all valid values, for the clipping threshold
+        self.unclippedMean = None
+        self.unclippedSquaredDeviationsSum = None
+        self.spectraCount = 0
+        self.rejectedCount = 0
+        self.average = None                 # cached average, invalidated by every new spectrum
+
+    def addSpectrum(self, spectrumX, spectrumY):
+        # returns False if the spectrum was rejected as an outlier
+        values = np.asarray(spectrumY, dtype=np.float64)
+        valid = np.isfinite(values)
+
+        if self.mean is None:
+            # only the state used by the selected statistic is allocated, the plain mean keeps three arrays
+            self.spectrumX = spectrumX
+            self.counts = valid.astype(np.int64)
+            self.mean = np.where(valid, values, 0.0)
+            self.squaredDeviationsSum = np.zeros(len(values))
+
+            if self.statistic == "median":
+                self.median = self.mean.copy()
+                self.absoluteDeviationMean = np.zeros(len(values))
+            elif self.statistic == "sigma clipping":
+                self.unclippedCounts = self.counts.copy()
+                self.unclippedMean = self.mean.copy()
+                self.unclippedSquaredDeviationsSum = np.zeros(len(values))
+
+            self.spectraCount = 1
+            self.average = None
+            return True
+
+        if len(values) != len(self.mean):
+            # equalize lengths of all spectra before averaging
+            length = min(len(values), len(self.mean))
+            self.spectrumX = self.spectrumX[:length]
+            for name in ("counts", "mean", "squaredDeviationsSum", "median", "absoluteDeviationMean",
+                         "unclippedCounts", "unclippedMean", "unclippedSquaredDeviationsSum"):
+                if getattr(self, name) is not None:
+                    setattr(self, name, getattr(self, name)[:length])
+            values = values[:length]
+            valid = valid[:length]
+
+        accepted = valid
+
+        if self.statistic == "sigma clipping" and self.spectraCount >= self.clipMinimalCount:
+            deviation = np.abs(values - self.mean)
+
+            if self.spectrumUnit == "W":
+                tolerance = (10 ** (self.clipToleranceDB / 10) - 1) * np.abs(self.mean)
+            else:
+                tolerance = self.clipToleranceDB
+
+            accepted = valid & (deviation <= np.maximum(self.clipSigma * self.getUnclippedStandardDeviation(),
+                                                        tolerance))
+
+            if 1.0 - np.count_nonzero(accepted) / max(np.count_nonzero(valid), 1) > self.rejectFraction:
+                # a rejected spectrum still widens the spread, a real change of the spectrum is accepted later
+                self.updateUnclippedStatistics(values, valid)
+                self.rejectedCount += 1
+                return False
+
+        if self.statistic == "sigma clipping":
+            self.updateUnclippedStatistics(values, valid)
+
+        self.counts += accepted
+        counts = np.maximum(self.counts, 1)
+
+        # Welford update of the bins with accepted values, in place
+        if np.all(accepted):
+            delta = values - self.mean
+            self.mean += delta / counts
+            self.squaredDeviationsSum += delta * (values - self.mean)
         else:
-            return None
\ No newline at end of file
+            delta = np.where(accepted, values - self.mean, 0.0)
+            self.mean += delta / counts
+            self.squaredDeviationsSum += delta * np.where(accepted, values - self.mean, 0.0)
+
+        if self.statistic == "median":
+            # Robbins-Monro step towards the new value, scaled by the spread of the values - for normally
+            # distributed values sigma = sqrt(pi / 2) * mean absolute deviation and the optimal gain is
+            # sqrt(pi / 2) * sigma / n
+            deviation = np.where(accepted, values - self.median, 0.0)
+            self.absoluteDeviationMean += (np.abs(deviation) - self.absoluteDeviationMean) * (accepted / counts)
+            self.median += (0.5 * np.pi) * self.absoluteDeviationMean / counts * np.sign(deviation)
+
+        self.spectraCount += 1
+        self.average = None
+        return True
+
+    def updateUnclippedStatistics(self, values, valid):
+        self.unclippedCounts += valid
+        delta = np.where(valid, values - self.unclippedMean, 0.0)
+        self.unclippedMean += delta / np.maximum(self.unclippedCounts, 1)
+        self.unclippedSquaredDeviationsSum += delta * np.where(valid, values - self.unclippedMean, 0.0)
+
+    def getUnclippedStandardDeviation(self):
+        # sample standard deviation of all valid values in every bin, clipped ones included
+        return np.sqrt(self.unclippedSquaredDeviationsSum / np.maximum(self.unclippedCounts - 1, 1))
+
+    def getAverage(self):
+        # average of every bin, NaN in bins without any valid value
+        if self.average is None:
+            average = self.median if self.statistic == "median" else self.mean
+            self.average = np.where(self.counts > 0, average, np.nan)
+
+        return self.average
+
+    def getStandardDeviation(self):
+        # sample standard deviation of the values in every bin
+        return np.sqrt(self.squaredDeviationsSum / np.maximum(self.counts - 1, 1))
+
+    def getStandardError(self):
+        # standard error of the average, the median of normally distributed values is sqrt(pi / 2) times less precise
+        standardError = self.getStandardDeviation() / np.sqrt(np.maximum(self.counts, 1))
+
+        if self.statistic == "median":
+            standardError *= np.sqrt(0.5 * np.pi)
+
+        return standardError
+
+    def getBand(self):
+        # average minus and plus its standard error, None until there are at least two spectra
+        if self.spectraCount < 2:
+            return None
+
+        average = self.getAverage()
+        standardError = self.getStandardError()
+        return average - standardError, average + standardError
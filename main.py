@@ -15,11 +15,14 @@ import settings_manager as SM
 import logging
 from tkinter.filedialog import asksaveasfilename
 from tkinter import filedialog
+from tkinter import messagebox
 from datetime import datetime
 import data_export_tool as DataExportTool
 import absorbanceTool as AbsorbanceTool
 import adjustmentTool as AdjustmentTool
 import data_processor as DataProcessor
+from scan_quality import getScanQualityModesList
+from result_bus import ResultBus
 class FTSApp:
 
     def __init__(self):
@@ -42,12 +45,14 @@ class FTSApp:
         # constants
         self.backgroundGray = "#242424"
         self.plotLineColor = "gold" # dodgerblue
+        self.plotRefreshInterval = 100  # [ms] results of the measurement threads are drawn at most this often
         self.currentSpectrumX = []
         self.currentSpectrumY = []
         self.currentInterferogramX = []
         self.currentInterferogramY = []
         self.currentAverageSpectrumX = []
         self.currentAverageSpectrumY = []
+        self.currentAverageSpectrumBand = None
         self.currentApodizationWindow = []
 
         self.currentlyAvailableCOMPorts = []
@@ -311,6 +316,16 @@ class FTSApp:
                                               command=self.onCmdScanSpeedUpdateFromSlider)
         self.scanSpeedSlider.grid(row=5, column=0, columnspan=2, sticky="N", padx=5, pady=5)
 
+        self.bidirectionalSwitch = ctk.CTkSwitch(master=self.settingsTabs.tab("Scan"),
+                                                 text="Acquire on return sweep",
+                                                 command=self.onBidirectionalSwitchModified,
+                                                 onvalue="True", offvalue="False")
+        self.bidirectionalSwitch.grid(row=6, column=0, columnspan=2, padx=5, pady=5, sticky="W")
+
+        if self.appSettings["bidirectionalScanning"] == "True":
+            self.bidirectionalSwitch.select()
+        else:
+            self.bidirectionalSwitch.deselect()
 
 
         sliderRange = float(self.appSettings["delayLineMaximumSpeed"]) - float(self.appSettings["delayLineMinimumSpeed"])
@@ -333,6 +348,11 @@ class FTSApp:
         self.settingsTabs.tab("Proc").rowconfigure(2, weight=1)
         self.settingsTabs.tab("Proc").rowconfigure(3, weight=1)
         self.settingsTabs.tab("Proc").rowconfigure(4, weight=1)
+        self.settingsTabs.tab("Proc").rowconfigure(5, weight=1)
+        self.settingsTabs.tab("Proc").rowconfigure(6, weight=1)
+        self.settingsTabs.tab("Proc").rowconfigure(7, weight=1)
+        self.settingsTabs.tab("Proc").rowconfigure(8, weight=1)
+        self.settingsTabs.tab("Proc").rowconfigure(9, weight=1)
 
         self.apodizationComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
                                                     text="Apodization\nwindow",
@@ -347,6 +367,106 @@ class FTSApp:
         # self.apodizationTypeCombo.set(DataProcessor.getApodizationWindowsTypesList()[0])
         self.apodizationTypeCombo.set(self.appSettings["apodizationWindow"])
 
+        self.precisionComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Processing\nprecision",
+                                                    font=ctk.CTkFont(size=12))
+        self.precisionComboLabel.grid(row=1, column=0, sticky="E", padx=5, pady=5)
+
+        self.precisionCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= DataProcessor.getProcessingPrecisionsList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.precisionCombo.grid(row=1, column=1, sticky="E", padx=5, pady=5)
+        self.precisionCombo.set(self.appSettings["processingPrecision"])
+
+        self.phaseExtractionComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Reference\nphase",
+                                                    font=ctk.CTkFont(size=12))
+        self.phaseExtractionComboLabel.grid(row=2, column=0, sticky="E", padx=5, pady=5)
+
+        self.phaseExtractionCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= DataProcessor.getPhaseExtractionMethodsList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.phaseExtractionCombo.grid(row=2, column=1, sticky="E", padx=5, pady=5)
+        self.phaseExtractionCombo.set(self.appSettings["phaseExtraction"])
+
+        self.algorithmComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Processing\nalgorithm",
+                                                    font=ctk.CTkFont(size=12))
+        self.algorithmComboLabel.grid(row=3, column=0, sticky="E", padx=5, pady=5)
+
+        self.algorithmCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= DataProcessor.getProcessingAlgorithmsList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.algorithmCombo.grid(row=3, column=1, sticky="E", padx=5, pady=5)
+        self.algorithmCombo.set(self.appSettings["processingAlgorithm"])
+
+        self.averagingModeComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Averaging\nmode",
+                                                    font=ctk.CTkFont(size=12))
+        self.averagingModeComboLabel.grid(row=4, column=0, sticky="E", padx=5, pady=5)
+
+        self.averagingModeCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= DataProcessor.getAveragingModesList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.averagingModeCombo.grid(row=4, column=1, sticky="E", padx=5, pady=5)
+        self.averagingModeCombo.set(self.appSettings["averagingMode"])
+
+        self.zeroPaddingComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Zero\npadding",
+                                                    font=ctk.CTkFont(size=12))
+        self.zeroPaddingComboLabel.grid(row=5, column=0, sticky="E", padx=5, pady=5)
+
+        self.zeroPaddingCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= DataProcessor.getZeroPaddingPoliciesList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.zeroPaddingCombo.grid(row=5, column=1, sticky="E", padx=5, pady=5)
+        self.zeroPaddingCombo.set(self.appSettings["zeroPaddingPolicy"])
+
+        self.decimationSwitch = ctk.CTkSwitch(master=self.settingsTabs.tab("Proc"),
+                                              text="Decimate raw data", command=self.onDecimationSwitchModified,
+                                              onvalue="True", offvalue="False")
+        self.decimationSwitch.grid(row=6, column=0, columnspan=2, padx=5, pady=5, sticky="W")
+
+        if self.appSettings["decimateRawData"] == "True":
+            self.decimationSwitch.select()
+        else:
+            self.decimationSwitch.deselect()
+
+        self.qualityGateComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Scan quality\ngate",
+                                                    font=ctk.CTkFont(size=12))
+        self.qualityGateComboLabel.grid(row=7, column=0, sticky="E", padx=5, pady=5)
+
+        self.qualityGateCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= getScanQualityModesList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.qualityGateCombo.grid(row=7, column=1, sticky="E", padx=5, pady=5)
+        self.qualityGateCombo.set(self.appSettings["scanQualityGate"])
+
+        self.averagingStatisticComboLabel = ctk.CTkLabel(master=self.settingsTabs.tab("Proc"),
+                                                    text="Averaging\nstatistic",
+                                                    font=ctk.CTkFont(size=12))
+        self.averagingStatisticComboLabel.grid(row=8, column=0, sticky="E", padx=5, pady=5)
+
+        self.averagingStatisticCombo = ctk.CTkComboBox(master=self.settingsTabs.tab("Proc"),
+                                                 values= DataProcessor.getAveragingStatisticsList(),
+                                                 state="readonly",
+                                                 width=130)
+        self.averagingStatisticCombo.grid(row=8, column=1, sticky="E", padx=5, pady=5)
+        self.averagingStatisticCombo.set(self.appSettings["averagingStatistic"])
+
+        self.reprocessButton = ctk.CTkButton(master=self.settingsTabs.tab("Proc"),
+                                             text="Reprocess stored scans",
+                                             corner_radius=10,
+                                             command=self.onCmdReprocess)
+        self.reprocessButton.grid(row=9, column=0, columnspan=2, sticky="EW", padx=5, pady=5)
+
         # configure settings 'TRIG' tab
         # ==============================================================================================================
         self.settingsTabs.tab("Trg").columnconfigure(0, weight=1)
@@ -705,14 +825,20 @@ class FTSApp:
         self.MFLIDrv = MFLIDriver(self.mfliIDBox.get("0.0", "end"))
         self.ZaberDrv = ZaberDriver()
 
-        # set up the background application controller
-        self.ApplicationController = BackgroundController(self.MFLIDrv, self.ZaberDrv)
-        self.ApplicationController.SetStatusMessageMethod = self.updateStatusMessage
-        self.ApplicationController.SetGeneralReadyFlagMethod = self.setGeneralReadyFlag
-        self.ApplicationController.SetDAQReadyFlagMethod = self.setDAQReadyFlag
-        self.ApplicationController.SetDelayLineReadyFlagMethod = self.setDelayLineReadyFlag
-        self.ApplicationController.SendResultsToPlot = self.receiveMeasurementResults
-        self.ApplicationController.NotifyAllMeasurementsDone = self.receiveNotificationAllMeasurementsDone
+        # set up the background application controller, it calls the GUI from its own threads, so the calls are
+        # posted to the result bus and carried out by the Tk main loop
+        self.ResultBus = ResultBus()
+        self.ApplicationController = BackgroundController(self.MFLIDrv, self.ZaberDrv,
+                                                          sessionDirectory=self.appSettings["sessionDirectory"] or None,
+                                                          scansKeptInMemory=int(self.appSettings["scansKeptInMemory"]))
+        self.ApplicationController.SetStatusMessageMethod = self.postToGUIThread(self.showStatusMessage)
+        self.ApplicationController.SetGeneralReadyFlagMethod = self.postToGUIThread(self.setGeneralReadyFlag)
+        self.ApplicationController.SetDAQReadyFlagMethod = self.postToGUIThread(self.setDAQReadyFlag)
+        self.ApplicationController.SetDelayLineReadyFlagMethod = self.postToGUIThread(self.setDelayLineReadyFlag)
+        self.ApplicationController.SendResultsToPlot = self.ResultBus.postResults
+        self.ApplicationController.NotifyAllMeasurementsDone = \
+            self.postToGUIThread(self.receiveNotificationAllMeasurementsDone)
+        self.ApplicationController.ShowErrorMethod = self.postToGUIThread(messagebox.showerror)
 
         # try to connect to all the hardware with some default settings
         self.ApplicationController.MFLIDeviceName = self.mfliIDBox.get("0.0", "end")
@@ -723,11 +849,32 @@ class FTSApp:
         # run the app
         self.root.update()
         self.root.deiconify()   # show the window after it's loaded
+        self.root.after(self.plotRefreshInterval, self.drainResultBus)
         self.root.mainloop()
 
-    def updateStatusMessage(self, message):
+    def postToGUIThread(self, method):
+        # the returned function may be called from any thread, the method itself runs in the Tk main loop
+        return lambda *arguments: self.ResultBus.postCall(method, *arguments)
+
+    def drainResultBus(self):
+        # carry out the calls posted by the measurement threads and draw the newest of their results,
+        # older results that were not drawn in time are skipped
+        try:
+            self.ResultBus.runPostedCalls()
+
+            snapshot = self.ResultBus.takeNewestResults()
+            if snapshot is not None:
+                self.receiveMeasurementResults(*snapshot)
+        finally:
+            self.root.after(self.plotRefreshInterval, self.drainResultBus)
+
+    def showStatusMessage(self, message):
         self.statusLabel.configure(text=message)
         logging.info(f"Status bar message set to: {message}")
+
+    def updateStatusMessage(self, message):
+        # immediate update, for the GUI thread only
+        self.showStatusMessage(message)
         self.root.update()
 
     def getApplicationSettings(self):
@@ -763,7 +910,7 @@ class FTSApp:
             logging.info(f"Delay line status: not ready")
 
     def receiveMeasurementResults(self, interfX, interfY, spectrumX, spectrumY, averageSpectrumX, averageSpectrumY,
-        completedMeasurements, apodizationWindow):
+        completedMeasurements, apodizationWindow, averageSpectrumBand=None):
 
         self.currentInterferogramX = interfX
         self.currentInterferogramY = interfY
@@ -771,6 +918,7 @@ class FTSApp:
         self.currentSpectrumY = spectrumY
         self.currentAverageSpectrumX = averageSpectrumX
         self.currentAverageSpectrumY = averageSpectrumY
+        self.currentAverageSpectrumBand = averageSpectrumBand
         self.currentApodizationWindow = apodizationWindow
 
         self.multipleMeasBox.delete(0, "end")
@@ -783,8 +931,17 @@ class FTSApp:
         self.updatePlot()
 
     def receiveNotificationAllMeasurementsDone(self):
-        logging.info("All ordered measurements done")
-        self.updateStatusMessage("Done")
+        logging.info(f"All ordered measurements done ({self.ResultBus.droppedCount} of {self.ResultBus.postedCount} "
+                     f"results posted since the start were not drawn)")
+
+        # mean processing time per scan and the stage that took most of it
+        stageTimer = self.ApplicationController.DataAnalyzer.stageTimer
+        meanSeconds = stageTimer.getMeanSeconds()
+
+        if meanSeconds is not None:
+            self.showStatusMessage(f"Done\n{meanSeconds:.2f} s/scan, mostly {stageTimer.getDominantStage()}")
+        else:
+            self.showStatusMessage("Done")
 
     def onCmdTriggerSwitchModified(self):
         self.onCmdRefreshTriggerSettings(None)
@@ -852,6 +1009,13 @@ class FTSApp:
         logging.info(f"Single capture started")
 
         self.appSettings["apodizationWindow"] = self.apodizationTypeCombo.get()
+        self.appSettings["processingPrecision"] = self.precisionCombo.get()
+        self.appSettings["phaseExtraction"] = self.phaseExtractionCombo.get()
+        self.appSettings["processingAlgorithm"] = self.algorithmCombo.get()
+        self.appSettings["averagingMode"] = self.averagingModeCombo.get()
+        self.appSettings["zeroPaddingPolicy"] = self.zeroPaddingCombo.get()
+        self.appSettings["scanQualityGate"] = self.qualityGateCombo.get()
+        self.appSettings["averagingStatistic"] = self.averagingStatisticCombo.get()
 
         self.settingsUsedForCurrentMeasurement = self.appSettings.copy()
         self.settingsUsedForCurrentMeasurement["averagingCount"] = 1
@@ -871,7 +1035,19 @@ class FTSApp:
                                                        trigLevel=float(self.appSettings["triggerLevel"]),
                                                        trigHysteresis=float(self.appSettings["triggerHysteresis"]),
                                                        trigReference=float(self.appSettings["triggerReference"]),
-                                                       apodizationWindow = self.apodizationTypeCombo.get())
+                                                       apodizationWindow = self.apodizationTypeCombo.get(),
+                                                       processingPrecision = self.precisionCombo.get(),
+                                                       phaseExtraction = self.phaseExtractionCombo.get(),
+                                                       processingAlgorithm = self.algorithmCombo.get(),
+                                                       spectrumRangeMin=float(self.appSettings["plotSpectrumXRangeMin"]),
+                                                       spectrumRangeMax=float(self.appSettings["plotSpectrumXRangeMax"]),
+                                                       averagingMode = self.averagingModeCombo.get(),
+                                                       zeroPaddingPolicy = self.zeroPaddingCombo.get(),
+                                                       decimationEnabled = self.appSettings["decimateRawData"] == "True",
+                                                       scanQualityMode = self.qualityGateCombo.get(),
+                                                       averagingStatistic = self.averagingStatisticCombo.get(),
+                                                       bidirectionalScanning =
+                                                       self.appSettings["bidirectionalScanning"] == "True")
 
     def onCmdMultipleCapture(self):
 
@@ -887,6 +1063,22 @@ class FTSApp:
 
         self.appSettings["apodizationWindow"] = self.apodizationTypeCombo.get()
         self.settingsUsedForCurrentMeasurement["apodizationWindow"] = self.apodizationTypeCombo.get()
+        self.appSettings["processingPrecision"] = self.precisionCombo.get()
+        self.settingsUsedForCurrentMeasurement["processingPrecision"] = self.precisionCombo.get()
+        self.appSettings["phaseExtraction"] = self.phaseExtractionCombo.get()
+        self.settingsUsedForCurrentMeasurement["phaseExtraction"] = self.phaseExtractionCombo.get()
+        self.appSettings["processingAlgorithm"] = self.algorithmCombo.get()
+        self.settingsUsedForCurrentMeasurement["processingAlgorithm"] = self.algorithmCombo.get()
+        self.appSettings["averagingMode"] = self.averagingModeCombo.get()
+        self.settingsUsedForCurrentMeasurement["averagingMode"] = self.averagingModeCombo.get()
+        self.appSettings["zeroPaddingPolicy"] = self.zeroPaddingCombo.get()
+        self.settingsUsedForCurrentMeasurement["zeroPaddingPolicy"] = self.zeroPaddingCombo.get()
+        self.settingsUsedForCurrentMeasurement["decimateRawData"] = self.appSettings["decimateRawData"]
+        self.settingsUsedForCurrentMeasurement["bidirectionalScanning"] = self.appSettings["bidirectionalScanning"]
+        self.appSettings["scanQualityGate"] = self.qualityGateCombo.get()
+        self.settingsUsedForCurrentMeasurement["scanQualityGate"] = self.qualityGateCombo.get()
+        self.appSettings["averagingStatistic"] = self.averagingStatisticCombo.get()
+        self.settingsUsedForCurrentMeasurement["averagingStatistic"] = self.averagingStatisticCombo.get()
 
         logging.info(f"Multiple captures with averaging started. Count = {measCount}")
 
@@ -907,7 +1099,52 @@ class FTSApp:
                                                        trigLevel=float(self.appSettings["triggerLevel"]),
                                                        trigHysteresis=float(self.appSettings["triggerHysteresis"]),
                                                        trigReference=float(self.appSettings["triggerReference"]),
-                                                       apodizationWindow = self.apodizationTypeCombo.get())
+                                                       apodizationWindow = self.apodizationTypeCombo.get(),
+                                                       processingPrecision = self.precisionCombo.get(),
+                                                       phaseExtraction = self.phaseExtractionCombo.get(),
+                                                       processingAlgorithm = self.algorithmCombo.get(),
+                                                       spectrumRangeMin=float(self.appSettings["plotSpectrumXRangeMin"]),
+                                                       spectrumRangeMax=float(self.appSettings["plotSpectrumXRangeMax"]),
+                                                       averagingMode = self.averagingModeCombo.get(),
+                                                       zeroPaddingPolicy = self.zeroPaddingCombo.get(),
+                                                       decimationEnabled = self.appSettings["decimateRawData"] == "True",
+                                                       scanQualityMode = self.qualityGateCombo.get(),
+                                                       averagingStatistic = self.averagingStatisticCombo.get(),
+                                                       bidirectionalScanning =
+                                                       self.appSettings["bidirectionalScanning"] == "True")
+
+    def onCmdReprocess(self):
+        # apply the processing settings to the scans of the last measurement without acquiring them again
+        logging.info(f"Reprocessing of stored scans requested")
+
+        reprocessingSettings = (("apodizationWindow", self.apodizationTypeCombo.get()),
+                                ("processingPrecision", self.precisionCombo.get()),
+                                ("phaseExtraction", self.phaseExtractionCombo.get()),
+                                ("processingAlgorithm", self.algorithmCombo.get()),
+                                ("averagingMode", self.averagingModeCombo.get()),
+                                ("zeroPaddingPolicy", self.zeroPaddingCombo.get()),
+                                ("averagingStatistic", self.averagingStatisticCombo.get()))
+
+        for key, value in reprocessingSettings:
+            self.appSettings[key] = value
+
+        accepted = self.ApplicationController.reprocessAll({
+            "apodizationWindow": self.apodizationTypeCombo.get(),
+            "processingPrecision": self.precisionCombo.get(),
+            "phaseExtraction": self.phaseExtractionCombo.get(),
+            "processingAlgorithm": self.algorithmCombo.get(),
+            "spectrumRangeMin": float(self.appSettings["plotSpectrumXRangeMin"]),
+            "spectrumRangeMax": float(self.appSettings["plotSpectrumXRangeMax"]),
+            "averagingMode": self.averagingModeCombo.get(),
+            "zeroPaddingPolicy": self.zeroPaddingCombo.get(),
+            "decimationEnabled": self.appSettings["decimateRawData"] == "True",
+            "averagingStatistic": self.averagingStatisticCombo.get()})
+
+        # the exported metadata describes the stored scans only once the controller has applied the settings to them
+        if accepted:
+            for key, value in reprocessingSettings:
+                self.settingsUsedForCurrentMeasurement[key] = value
+
     def onCmdStopMeasurement(self):
         self.ApplicationController.requestStop()
 
@@ -944,6 +1181,12 @@ class FTSApp:
         print(self.appSettings["saveDataToMAT"])
         print(self.appSettings["saveRawData"])
 
+    def onDecimationSwitchModified(self):
+        self.appSettings["decimateRawData"] = self.decimationSwitch.get()
+
+    def onBidirectionalSwitchModified(self):
+        self.appSettings["bidirectionalScanning"] = self.bidirectionalSwitch.get()
+
     def onCmdUpdateStartingPositionFromBox(self, other):
         minSetting = 2000
         maxSetting = ZaberDriver.DelayLineNominalLength
@@ -1188,18 +1431,21 @@ class FTSApp:
         DataExportTool.exportAllDataMultipleMeasurements(
             averageSpectrumX            = self.currentAverageSpectrumX,
             averageSpectrumY            = self.currentAverageSpectrumY,
+            averageSpectrumBand         = self.currentAverageSpectrumBand,
             rawSpectraX                 = self.ApplicationController.spectraX,
-            rawSpectraY                 = self.ApplicationController.spectraY,
+            rawSpectraY                 = self.ApplicationController.getSpectraYInDBm(),
             correctedInterferogramsX    = self.ApplicationController.processedInterferogramsX,
             correctedInterferogramsY    = self.ApplicationController.processedInterferogramsY,
             interferogramsRaw           = self.ApplicationController.rawInterferograms,
             referenceSignalsRaw         = self.ApplicationController.rawReferenceSignals,
+            backwardScans               = self.ApplicationController.backwardScans,
             settings                    = self.settingsUsedForCurrentMeasurement,
             comments                    = self.commentsTextBox.get("0.0", "end")
         )
 
     def onClosing(self):
         SM.saveSettingsToFile(self.appSettings)
+        self.ApplicationController.closeSession()
         # make sure the application closes properly when the main window is destroyed
         logging.info('========= Application closed =========\n\n\n')
         sys.exit()
@@ -1208,7 +1454,7 @@ class FTSApp:
         self.loadDataToPlots(self.currentInterferogramX, self.currentInterferogramY,
                              self.currentSpectrumX, self.currentSpectrumY,
                              self.currentAverageSpectrumX, self.currentAverageSpectrumY, 0,
-                             self.currentApodizationWindow)
+                             self.currentApodizationWindow, self.currentAverageSpectrumBand)
 
     def giveSpectrumForAbsorbanceLast(self):
         return ('Wavelength [\u03BCm]', 'Intensity [dBm]',
@@ -1218,7 +1464,7 @@ class FTSApp:
         return ('Wavelength [\u03BCm]', 'Intensity [dBm]',
                 self.currentAverageSpectrumX.copy(), self.currentAverageSpectrumY.copy())
     def loadDataToPlots(self, interferogramX, interferogramY, spectrumX, spectrumY, averageSpectrumX, averageSpectrumY,
-                        completedMeasurements, apodizationWindow):
+                        completedMeasurements, apodizationWindow, averageSpectrumBand=None):
 
         if completedMeasurements != 0:
             self.multipleMeasBox.delete(0, "end")
@@ -1293,6 +1539,11 @@ class FTSApp:
 
             self.axBot.plot(spectrumXAxisToPlotAverage, averageSpectrumY, color=self.plotLineColor)
 
+            # uncertainty of the average spectrum (+/- standard error of every bin)
+            if averageSpectrumBand is not None and len(averageSpectrumBand[0]) == len(spectrumXAxisToPlotAverage):
+                self.axBot.fill_between(spectrumXAxisToPlotAverage, averageSpectrumBand[0], averageSpectrumBand[1],
+                                        color=self.plotLineColor, alpha=0.3, linewidth=0)
+
         # plot interferogram
         self.axTop.grid(color="dimgrey", linestyle='-', linewidth=1, alpha=0.6)
 
@@ -1345,7 +1596,6 @@ class FTSApp:
 
         self.canvasTopPlot.draw()
         self.canvasBotPlot.draw()
-        self.root.update()
 
 
 # run the app
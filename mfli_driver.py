@@ -3,13 +3,11 @@ import zhinst.core
 import zhinst.utils
 import logging
 from datetime import datetime
+from mfli_sampling_rates import MFLISamplingRates
 
 class MFLIDriver:
 
-    MFLISamplingRates = (6.0E7, 3.0E7, 1.5E7, 7.5E6,
-                         3.75E6, 1.88E6, 9.38E5, 4.69E5,
-                         2.34E5, 1.17E5, 5.86E4, 2.93E4,
-                         1.46E4, 7.32E3, 3.66E3, 1.83E3)
+    MFLISamplingRates = MFLISamplingRates
 
     def __init__(self, devID):
         print("MFLI driver initializing...")
@@ -116,6 +114,12 @@ class MFLIDriver:
         # force global synchronization between the device and the data server
         self.DAQ.sync()
 
+    def setTriggerReference(self, triggerReference):
+        # position of the trigger within the record [%], can be changed between records without reconfiguration
+        logging.info(f"MFLI driver: trigger reference: {triggerReference} %")
+        self.DAQ.setDouble(f'/{self.deviceID}/scopes/0/trigreference', triggerReference / 100.0)
+        self.DAQ.sync()
+
     def armTrigger(self):
         print("Debug - trigger prearm")
         try:
@@ -0,0 +1,7 @@
+# sampling rates of the MFLI scope [Hz], indexed by the value of the scopes/0/time node; kept apart from the driver
+# so that code without the hardware (benchmarks, offline processing) does not need the zhinst package
+
+MFLISamplingRates = (6.0E7, 3.0E7, 1.5E7, 7.5E6,
+                     3.75E6, 1.88E6, 9.38E5, 4.69E5,
+                     2.34E5, 1.17E5, 5.86E4, 2.93E4,
+                     1.46E4, 7.32E3, 3.66E3, 1.83E3)
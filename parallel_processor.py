@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from data_processor import DataProcessor
+
+# state of a worker process - shared memory blocks attached once per process and its own DataProcessor
+workerState = {}
+
+
+def createSharedArray(shape, dtype):
+    sharedMemory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+    return sharedMemory, np.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf)
+
+
+def attachSharedArray(name, shape, dtype):
+    sharedMemory = shared_memory.SharedMemory(name=name)
+    return sharedMemory, np.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf)
+
+
+def initializeWorker(arrays, lengths, backwardScans, configuration, apodizationWindowType):
+    # arrays: array name -> (shared memory name, shape, dtype)
+    workerState["sharedMemory"] = []
+
+    for arrayName, (sharedMemoryName, shape, dtype) in arrays.items():
+        sharedMemory, array = attachSharedArray(sharedMemoryName, shape, dtype)
+        workerState["sharedMemory"].append(sharedMemory)
+        workerState[arrayName] = array
+
+    dataProcessor = DataProcessor()
+    dataProcessor.setConfiguration(configuration)
+    # scans are processed in parallel already, a multi-threaded FFT would only oversubscribe the cores
+    dataProcessor.fftPlanner.workers = 1
+
+    workerState["lengths"] = lengths
+    workerState["backwardScans"] = backwardScans
+    workerState["dataProcessor"] = dataProcessor
+    workerState["apodizationWindowType"] = apodizationWindowType
+
+
+def processStoredScan(index, returnDetails):
+    # processes a single scan, the spectrum is written directly to the shared memory; the processed interferogram
+    # is returned, its length depends on the engine (shorter than the raw one when the raw signals are decimated,
+    # longer when the zoom FFT resamples it more densely); details needed for the plot (interferogram before
+    # apodization and the window) are returned only on request
+    length = workerState["lengths"][index]
+    dataProcessor = workerState["dataProcessor"]
+
+    results = dataProcessor.processInto(rawReferenceSignal=workerState["referenceSignals"][index, :length],
+                                        rawInterferogram=workerState["interferograms"][index, :length],
+                                        apodizationWindowType=workerState["apodizationWindowType"],
+                                        out=workerState["spectraY"][index],
+                                        backwardScan=workerState["backwardScans"][index])
+
+    details = None
+    if returnDetails:
+        details = {"rawInterferogramY": results["rawInterferogramY"],
+                   "apodizationWindow": results["apodizationWindow"]}
+
+    return index, results["interferogramX"], results["interferogramY"], results["timings"], details
+
+
+class ParallelScanProcessor:
+
+    def __init__(self, workersCount=None):
+        # number of worker processes, None = number of CPU cores; every worker needs memory for a full
+        # processing chain of a single scan (the padded FFT dominates), so it can be limited for long scans
+        self.workersCount = workersCount
+
+    def getWorkersCount(self, scansCount):
+        workersCount = self.workersCount if self.workersCount is not None else os.cpu_count()
+        return max(1, min(workersCount or 1, scansCount))
+
+    def process(self, dataProcessor, referenceSignals, interferograms, apodizationWindowType,
+                progressCallback=None, backwardScans=None):
+        # processes all scans with copies of the given processor, raw signals are passed to the workers and spectra
+        # are returned through shared memory; returns results of all scans in the order of the input lists;
+        # backwardScans - flags of the scans acquired on the return sweep of the delay line
+        scansCount = len(interferograms)
+        lengths = [len(interferogram) for interferogram in interferograms]
+
+        if backwardScans is None:
+            backwardScans = [False] * scansCount
+        maxLength = max(lengths)
+        spectrumLength = dataProcessor.getSpectrumLength()
+
+        arrayShapes = {"referenceSignals": ((scansCount, maxLength), np.float64),
+                       "interferograms": ((scansCount, maxLength), np.float64),
+                       "spectraY": ((scansCount, spectrumLength), dataProcessor.realType)}
+
+        sharedMemory = []
+        arrays = {}
+        arrayDescriptions = {}
+
+        try:
+            for arrayName, (shape, dtype) in arrayShapes.items():
+                block, array = createSharedArray(shape, dtype)
+                sharedMemory.append(block)
+                arrays[arrayName] = array
+                arrayDescriptions[arrayName] = (block.name, shape, np.dtype(dtype).str)
+
+            for i in range(scansCount):
+                arrays["referenceSignals"][i, :lengths[i]] = referenceSignals[i]
+                arrays["interferograms"][i, :lengths[i]] = interferograms[i]
+
+            timings = [None] * scansCount
+            interferogramsX = [None] * scansCount
+            interferogramsY = [None] * scansCount
+            details = None
+
+            with ProcessPoolExecutor(max_workers=self.getWorkersCount(scansCount),
+                                     initializer=initializeWorker,
+                                     initargs=(arrayDescriptions, lengths, list(backwardScans),
+                                               dataProcessor.getConfiguration(),
+                                               apodizationWindowType)) as executor:
+
+                futures = [executor.submit(processStoredScan, i, i == scansCount - 1) for i in range(scansCount)]
+
+                for completedCount, future in enumerate(as_completed(futures), start=1):
+                    index, interferogramX, interferogramY, scanTimings, scanDetails = future.result()
+                    interferogramsX[index] = interferogramX
+                    interferogramsY[index] = interferogramY
+                    timings[index] = scanTimings
+
+                    if scanDetails is not None:
+                        details = scanDetails
+
+                    if progressCallback is not None:
+                        progressCallback(completedCount, scansCount)
+
+            # copy the results out of the shared memory before it is released
+            output = {"interferogramsX": interferogramsX,
+                      "interferogramsY": interferogramsY,
+                      "spectraY": [np.copy(arrays["spectraY"][i]) for i in range(scansCount)],
+                      "timings": timings,
+                      "lastScanDetails": details}
+
+        finally:
+            # views of the shared memory have to be released before it is closed
+            arrays.clear()
+            array = None
+            for block in sharedMemory:
+                block.close()
+                block.unlink()
+
+        return output
@@ -0,0 +1,102 @@
+from collections import namedtuple
+from queue import Queue, Empty
+
+import numpy as np
+
+from data_processor import convertWattsToDBm
+
+# results of a processed scan passed from the measurement threads to the GUI, the fields follow the arguments
+# of BackgroundController.SendResultsToPlot
+ResultSnapshot = namedtuple("ResultSnapshot", ["interferogramX", "interferogramY",
+                                               "spectrumX", "spectrumY",
+                                               "averageSpectrumX", "averageSpectrumY",
+                                               "completedMeasurements", "apodizationWindow",
+                                               "averageSpectrumBand"])
+
+
+def convertSnapshotToDBm(snapshot):
+    # spectra of the power averaging mode are posted in watts, the lower bound of the band may fall to zero power
+    band = snapshot.averageSpectrumBand
+
+    if band is not None:
+        band = (convertWattsToDBm(np.maximum(band[0], np.finfo(float).tiny)), convertWattsToDBm(band[1]))
+
+    return snapshot._replace(spectrumY=convertWattsToDBmOrNone(snapshot.spectrumY),
+                             averageSpectrumY=convertWattsToDBmOrNone(snapshot.averageSpectrumY),
+                             averageSpectrumBand=band)
+
+
+def convertWattsToDBmOrNone(spectrum):
+    return None if spectrum is None else convertWattsToDBm(spectrum)
+
+
+def freezeArray(array):
+    # read-only view, the producer hands the array over and does not modify it afterwards
+    if array is None:
+        return None
+
+    view = np.asarray(array).view()
+    view.flags.writeable = False
+    return view
+
+
+class ResultBus:
+
+    def __init__(self):
+        # any thread may post, only the GUI thread takes the posted items out
+        self.snapshots = Queue()
+        self.calls = Queue()
+        self.postedCount = 0
+        self.droppedCount = 0   # snapshots replaced by a newer one before they were rendered
+
+    def postResults(self, interferogramX, interferogramY, spectrumX, spectrumY, averageSpectrumX, averageSpectrumY,
+                    completedMeasurements, apodizationWindow, averageSpectrumBand=None, spectrumUnit="dBm"):
+        # spectrumUnit - "dBm" or "W", spectra in watts are converted to dBm only when they are taken for drawing
+        if averageSpectrumBand is not None:
+            averageSpectrumBand = (freezeArray(averageSpectrumBand[0]), freezeArray(averageSpectrumBand[1]))
+
+        self.snapshots.put((ResultSnapshot(freezeArray(interferogramX), freezeArray(interferogramY),
+                                           freezeArray(spectrumX), freezeArray(spectrumY),
+                                           freezeArray(averageSpectrumX), freezeArray(averageSpectrumY),
+                                           completedMeasurements, freezeArray(apodizationWindow),
+                                           averageSpectrumBand), spectrumUnit))
+        self.postedCount += 1
+
+    def postCall(self, method, *arguments):
+        # GUI method (status message, ready flags...) to be called from the GUI thread in the order of posting
+        self.calls.put((method, arguments))
+
+    def takeNewestResults(self):
+        # newest posted snapshot [dBm] or None, older snapshots waiting in the queue are dropped
+        newest = None
+
+        while True:
+            try:
+                item = self.snapshots.get_nowait()
+            except Empty:
+                break
+
+            if newest is not None:
+                self.droppedCount += 1
+
+            newest = item
+
+        if newest is None:
+            return None
+
+        # only the snapshot that is drawn is converted
+        snapshot, spectrumUnit = newest
+
+        if spectrumUnit == "W":
+            return convertSnapshotToDBm(snapshot)
+
+        return snapshot
+
+    def runPostedCalls(self):
+        while True:
+            try:
+                method, arguments = self.calls.get_nowait()
+            except Empty:
+                return
+
+            method(*arguments)
@@ -0,0 +1,180 @@
+import numpy as np
+from scipy.signal import hilbert
+
+
+def getScanQualityModesList():
+    return [
+    "off",
+    "flag",
+    "reject",
+]
+
+
+class ScanQualityGate:
+
+    def __init__(self):
+        # the scan is split into blocks, fringe amplitude and mirror velocity are compared between the blocks
+        self.blocksCount = 256
+        self.minimalBlockLength = 64
+        self.minimalBlockFringes = 4            # blocks of the velocity checks are merged to hold at least this many fringes
+        self.samplesPerFringe = 16              # the reference is averaged down to about this many samples per fringe
+        self.fringeEstimationLength = 65536     # length of the segment used to estimate the fringe frequency
+
+        # thresholds, a scan failing any of the checks is flagged or rejected
+        self.minimalFringeContrast = 0.3        # lowest fringe amplitude of a block relative to the median one
+        self.maximalVelocityJitter = 0.2        # rms deviation of the block velocity relative to the median one
+        self.minimalRelativeVelocity = 0.5      # slowest block relative to the median velocity (stalled mirror)
+        self.minimalZPDProminence = 10.0        # ZPD peak relative to the median rms of the interferogram blocks
+        self.nearExtremeRange = 0.02            # samples closer to the extreme than this share of the span...
+        self.nearExtremeCodes = 16              # ...or than this number of ADC code steps are near the extreme
+        self.maximalFlatTopRatio = 0.5          # samples at the extreme value relative to the samples near it
+
+    def check(self, rawReferenceSignal, rawInterferogram):
+        # cheap checks of the raw records done before the processing, returns the measured quality figures
+        # together with the list of reasons why the scan is bad (empty for a good scan)
+        if rawReferenceSignal is None or rawInterferogram is None or len(rawInterferogram) == 0:
+            return {"saturatedSamples": 0, "flatTopRatio": 0.0, "fringeContrast": None, "velocityJitter": None,
+                    "relativeVelocity": None, "zpdProminence": None, "reasons": ["empty record"]}
+
+        ref_volt = rawReferenceSignal - np.mean(rawReferenceSignal)
+        meas_volt = rawInterferogram - np.mean(rawInterferogram)
+
+        referenceSamples, referenceRatio = self.measureFlatTops(rawReferenceSignal)
+        interferogramSamples, interferogramRatio = self.measureFlatTops(rawInterferogram)
+
+        quality = {"saturatedSamples": max(referenceSamples, interferogramSamples),
+                   "flatTopRatio": max(referenceRatio, interferogramRatio),
+                   "fringeContrast": None,
+                   "velocityJitter": None,
+                   "relativeVelocity": None,
+                   "zpdProminence": None,
+                   "reasons": []}
+
+        # the number of fringes in the scan limits the number of blocks, a block shorter than a fringe does not
+        # reach the full fringe amplitude
+        phase, phaseIdx = self.calculateReferencePhase(ref_volt)
+        fringesCount = (phase[-1] - phase[0]) / (2 * np.pi) if len(phase) > 1 else 0.0
+        blocksCount = min(self.blocksCount, len(ref_volt) // self.minimalBlockLength, int(fringesCount))
+
+        if blocksCount >= 3:
+            blockLength = len(ref_volt) // blocksCount
+            refBlocks = ref_volt[:blocksCount * blockLength].reshape(blocksCount, blockLength)
+            measBlocks = meas_volt[:blocksCount * blockLength].reshape(blocksCount, blockLength)
+
+            # fringe amplitude of every block
+            amplitude = np.ptp(refBlocks, axis=1)
+            quality["fringeContrast"] = float(np.min(amplitude) / max(np.median(amplitude), np.finfo(float).tiny))
+
+            # the mirror velocity of a block is the slope of the reference phase, the blocks are merged until each
+            # of them holds several fringes; the first and the last block may contain the acceleration of the
+            # delay line and are skipped
+            velocity = self.measureBlockVelocity(phase, phaseIdx, min(blocksCount,
+                                                                      int(fringesCount // self.minimalBlockFringes)))
+
+            if velocity is not None:
+                medianVelocity = max(np.median(velocity), np.finfo(float).tiny)
+                quality["velocityJitter"] = float(np.sqrt(np.mean((velocity / medianVelocity - 1.0) ** 2)))
+                quality["relativeVelocity"] = float(np.min(velocity) / medianVelocity)
+
+            # the ZPD burst stands out against the noise floor estimated from the rms of the blocks
+            noiseLevel = np.median(np.std(measBlocks, axis=1))
+            quality["zpdProminence"] = float(np.max(np.abs(meas_volt)) / max(noiseLevel, np.finfo(float).tiny))
+
+            if quality["fringeContrast"] < self.minimalFringeContrast:
+                quality["reasons"].append("lost reference fringes")
+
+            if quality["relativeVelocity"] is not None:
+                if quality["relativeVelocity"] < self.minimalRelativeVelocity:
+                    quality["reasons"].append("mirror stalled")
+                elif quality["velocityJitter"] > self.maximalVelocityJitter:
+                    quality["reasons"].append("mirror velocity jitter")
+
+            if quality["zpdProminence"] < self.minimalZPDProminence:
+                quality["reasons"].append("no ZPD")
+
+        if quality["flatTopRatio"] > self.maximalFlatTopRatio:
+            quality["reasons"].append("saturated detector")
+
+        return quality
+
+    def calculateReferencePhase(self, ref_volt):
+        # unwrapped phase of the reference; an oversampled reference is first averaged in blocks down to a few
+        # samples per fringe, which makes the analytic signal cheap and suppresses the noise near the zero crossings;
+        # returns the phase together with the positions of its samples in the record
+        if len(ref_volt) < 2:
+            return np.zeros(0), np.zeros(0)
+
+        decimation = max(1, int(self.estimateSamplesPerFringe(ref_volt) / self.samplesPerFringe))
+        decimatedCount = len(ref_volt) // decimation
+
+        if decimatedCount < 2:
+            return np.zeros(0), np.zeros(0)
+
+        decimated = ref_volt[:decimatedCount * decimation].reshape(decimatedCount, decimation).mean(axis=1)
+        phase = np.unwrap(np.angle(hilbert(decimated - np.mean(decimated))))
+        phaseIdx = np.arange(decimatedCount) * decimation + 0.5 * (decimation - 1)
+
+        return phase, phaseIdx
+
+    def estimateSamplesPerFringe(self, ref_volt):
+        # fringe period from the periodogram peak of a segment taken from the middle of the scan, a coarse estimate
+        # is enough to choose the averaging length
+        segmentLength = min(len(ref_volt), self.fringeEstimationLength)
+        segmentStart = (len(ref_volt) - segmentLength) // 2
+        segment = ref_volt[segmentStart:segmentStart + segmentLength]
+
+        power = np.abs(np.fft.rfft(segment - np.mean(segment))) ** 2
+
+        if len(power) < 2:
+            return 1.0
+
+        return segmentLength / (int(np.argmax(power[1:])) + 1)
+
+    def measureBlockVelocity(self, phase, phaseIdx, blocksCount):
+        # least-squares slope of the phase in every block [rad / sample] without the first and the last block,
+        # None when the blocks would be too few or too short to compare
+        if blocksCount < 5 or len(phase) // blocksCount < 2:
+            return None
+
+        blockLength = len(phase) // blocksCount
+        phaseBlocks = phase[:blocksCount * blockLength].reshape(blocksCount, blockLength)[1:-1]
+        idxBlocks = phaseIdx[:blocksCount * blockLength].reshape(blocksCount, blockLength)[1:-1]
+
+        idxDeviation = idxBlocks - np.mean(idxBlocks, axis=1, keepdims=True)
+        phaseDeviation = phaseBlocks - np.mean(phaseBlocks, axis=1, keepdims=True)
+
+        return np.sum(idxDeviation * phaseDeviation, axis=1) / np.sum(idxDeviation ** 2, axis=1)
+
+    def measureFlatTops(self, signal):
+        # a quantized signal within the input range also stays at its top code around the fringe peaks, but it
+        # approaches the peak with zero slope, so only a small part of the samples near the extreme is at the extreme
+        # code (about sqrt(code step / near range)); a clipped signal arrives at the extreme with a finite slope
+        # and most of the samples near the extreme are held at it; returns the number of samples at the extreme value
+        # and their ratio to the samples near the extreme, the larger of the two extremes
+        samplesCount = 0
+        flatTopRatio = 0.0
+
+        for extremeValue, direction in ((np.max(signal), -1.0), (np.min(signal), 1.0)):
+            distance = direction * (signal - extremeValue)
+            nearExtreme = distance <= self.nearExtremeRange * np.ptp(signal)
+
+            # the code step is the smallest difference between the values near the extreme, a channel using only
+            # a small part of the input range spans few codes, so the near range is widened to several code steps
+            codeSteps = np.diff(np.unique(distance[nearExtreme]))
+
+            if len(codeSteps) > 0:
+                nearExtreme = distance <= max(self.nearExtremeRange * np.ptp(signal),
+                                              self.nearExtremeCodes * np.min(codeSteps))
+
+            flatTopSamples = int(np.count_nonzero(distance == 0))
+            samplesCount = max(samplesCount, flatTopSamples)
+            flatTopRatio = max(flatTopRatio, flatTopSamples / max(np.count_nonzero(nearExtreme), 1))
+
+        return samplesCount, float(flatTopRatio)
+
+    def formatQuality(self, quality):
+        figures = [f"{name} {quality[name]:.3g}" for name in ("fringeContrast", "velocityJitter", "relativeVelocity",
+                                                               "zpdProminence") if quality[name] is not None]
+        figures.append(f"saturatedSamples {quality['saturatedSamples']}")
+        figures.append(f"flatTopRatio {quality['flatTopRatio']:.3g}")
+        return ", ".join(figures)
@@ -0,0 +1,191 @@
+import os
+import shutil
+import tempfile
+import logging
+
+import numpy as np
+
+
+class ScanArrayStore:
+
+    # start of every array in the file [bytes], keeps the memory mapped views aligned
+    alignment = 64
+
+    def __init__(self, directory, name, recentCount):
+        # append-only sequence of 1D arrays of one kind (one per scan) written to a file in the session directory;
+        # the last recentCount arrays are kept in RAM as well, older ones are returned as read-only views of the
+        # memory mapped file, so reading them does not copy anything. Replacing an array appends its new version,
+        # views handed out earlier stay valid
+        self.directory = directory
+        self.name = name
+        self.recentCount = recentCount
+        self.generation = 0     # clear() starts a new file, views of the old one may still be in use
+        self.path = None
+        self.file = None
+        self.fileSize = 0
+        self.map = None
+        self.items = []         # offset [bytes], length and dtype of every array
+        self.recent = {}        # item number -> array kept in RAM
+        self.openFile()
+
+    def openFile(self):
+        self.path = os.path.join(self.directory, f"{self.name}_{self.generation}.bin")
+        self.file = open(self.path, "wb")
+        self.fileSize = 0
+        self.map = None
+
+    def closeFile(self):
+        self.file.close()
+        self.map = None
+
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            # a file still mapped by a view is removed together with the session directory
+            logging.info(f"Session store: {self.path} not removed ({e})")
+
+    def writeArray(self, array):
+        array = np.ascontiguousarray(array)
+        padding = -self.fileSize % self.alignment
+
+        # a write that failed halfway (e.g. full disk) is overwritten by the next one
+        self.file.seek(self.fileSize)
+
+        if padding > 0:
+            self.file.write(bytes(padding))
+
+        offset = self.fileSize + padding
+        array.tofile(self.file)
+        self.file.flush()
+        self.fileSize = offset + array.nbytes
+
+        return array, (offset, len(array), array.dtype)
+
+    def append(self, array):
+        array, item = self.writeArray(array)
+        self.items.append(item)
+
+        self.recent[len(self.items) - 1] = array
+        self.evictOldArrays()
+
+    def __setitem__(self, index, array):
+        index = range(len(self.items))[index]
+        array, self.items[index] = self.writeArray(array)
+
+        if index >= len(self.items) - self.recentCount:
+            self.recent[index] = array
+        else:
+            self.recent.pop(index, None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self.items))[index]]
+
+        index = range(len(self.items))[index]
+
+        if index in self.recent:
+            return self.recent[index]
+
+        offset, length, dtype = self.items[index]
+        nbytes = length * dtype.itemsize
+
+        # the map is extended only when an array beyond its end is requested
+        if self.map is None or len(self.map) < offset + nbytes:
+            self.map = np.memmap(self.path, dtype=np.uint8, mode="r")
+
+        return self.map[offset:offset + nbytes].view(dtype)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        for i in range(len(self.items)):
+            yield self[i]
+
+    def evictOldArrays(self):
+        firstRecent = len(self.items) - self.recentCount
+
+        for index in [index for index in self.recent if index < firstRecent]:
+            del self.recent[index]
+
+    def truncate(self, length):
+        # drops the arrays from the given item number on, their data stays in the file until it is cleared
+        del self.items[length:]
+
+        for index in [index for index in self.recent if index >= length]:
+            del self.recent[index]
+
+    def clear(self):
+        self.closeFile()
+        self.generation += 1
+        self.items = []
+        self.recent = {}
+        self.openFile()
+
+    def close(self):
+        self.closeFile()
+        self.items = []
+        self.recent = {}
+
+
+class MappedScanArrays:
+
+    def __init__(self, arrays, function):
+        # read-only sequence of the arrays transformed by the function on access (e.g. unit conversion),
+        # so that the transformed arrays of all scans are never held in memory at once
+        self.arrays = arrays
+        self.function = function
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.function(array) for array in self.arrays[index]]
+
+        return self.function(self.arrays[index])
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def __iter__(self):
+        for array in self.arrays:
+            yield self.function(array)
+
+
+class ScanSessionStore:
+
+    def __init__(self, workingDirectory=None, recentCount=8):
+        # per-scan arrays of a measurement session in a temporary directory created within the working directory
+        # (None - the system temporary directory), recentCount - number of the last scans kept in RAM
+        self.recentCount = recentCount
+        self.directory = tempfile.mkdtemp(prefix="fts_session_", dir=workingDirectory)
+        self.stores = []
+        self.storesCreatedCount = 0     # numbers the files, a replacement store never reuses the file of the old one
+
+        logging.info(f"Session store created in {self.directory}")
+
+    def createArrayStore(self, name):
+        store = ScanArrayStore(self.directory, f"{name}_{self.storesCreatedCount}", self.recentCount)
+        self.storesCreatedCount += 1
+        self.stores.append(store)
+        return store
+
+    def removeArrayStore(self, store):
+        # removes the file of a store replaced by a new one
+        store.close()
+        self.stores.remove(store)
+
+    def setRecentCount(self, recentCount):
+        self.recentCount = recentCount
+
+        for store in self.stores:
+            store.recentCount = recentCount
+            store.evictOldArrays()
+
+    def getDiskUsage(self):
+        # bytes written to the files of the session
+        return sum(store.fileSize for store in self.stores)
+
+    def close(self):
+        for store in self.stores:
+            store.close()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
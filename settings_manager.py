@@ -72,7 +72,18 @@ def getDefaultSettings():
         "adjustmentAmplitude" : "5000.0",
         "adjustmentPeriod" : "2000.0",
 
-        "apodizationWindow" : "boxcar"
+        "apodizationWindow" : "boxcar",
+        "processingPrecision" : "float64",
+        "phaseExtraction" : "hilbert",
+        "processingAlgorithm" : "hilbert",
+        "averagingMode" : "spectrum",
+        "zeroPaddingPolicy" : "fixed",
+        "decimateRawData" : "False",
+        "scanQualityGate" : "off",
+        "averagingStatistic" : "mean",
+        "bidirectionalScanning" : "False",
+        "sessionDirectory" : "",
+        "scansKeptInMemory" : "8"
     }
 
     return  defaultSettings
\ No newline at end of file